@@ -1,6 +1,24 @@
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 load_dotenv()
-GROK_API_KEY = os.getenv("GROK_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
\ No newline at end of file
+
+
+@dataclass(frozen=True)
+class Settings:
+    """API configuration read from the environment once at import"""
+    grok_api_key: str
+    gemini_api_key: str
+    # Reuse Grok analyses across similar (not identical) patients; off by default
+    semantic_cache_enabled: bool = False
+
+
+settings = Settings(
+    grok_api_key=os.getenv("GROK_API_KEY", ""),
+    gemini_api_key=os.getenv("GEMINI_API_KEY", ""),
+    semantic_cache_enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "").lower() in ("1", "true", "yes"),
+)
+
+GROK_API_KEY = settings.grok_api_key
+GEMINI_API_KEY = settings.gemini_api_key
@@ -0,0 +1,78 @@
+"""
+Helpers shared by the LLM client modules (OpenRouter, Grok/Gemini)
+JSON encoding, retry policy and prompt field clipping
+"""
+
+import json
+import random
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401 - enables HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    logger.warning("h2 not available - LLM API calls will use HTTP/1.1")
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("orjson not available - using stdlib json for API payloads")
+
+# Retry policy for transient upstream errors (429 / 5xx / connection refused)
+MAX_RETRIES = 3
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRY_BACKOFF = 1.0  # seconds, doubled on every attempt (before jitter)
+RETRY_MAX_DELAY = 10.0  # cap for backoff and for the server's Retry-After
+
+# Only errors raised before the request reached the upstream are safe to resend
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Longest a single patient field may be once rendered into a prompt; bounds
+# tokens (cost, latency) when users paste long histories or injected text
+PROMPT_FIELD_MAX_CHARS = 500
+
+
+def json_dumps(obj, sort_keys: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when installed)"""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=str, option=option)
+    return json.dumps(obj, sort_keys=sort_keys, default=str, ensure_ascii=False).encode("utf-8")
+
+
+def json_loads(data):
+    """Parse JSON from str or bytes (orjson when installed)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before the next attempt
+    Honors a numeric Retry-After from the upstream, otherwise capped exponential
+    backoff with full jitter so concurrent retries don't land together
+    """
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), RETRY_MAX_DELAY)
+        except ValueError:
+            pass  # HTTP-date form - fall back to backoff
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BACKOFF * (2 ** attempt)))
+
+
+def clip_field(name: str, value, limit: int = PROMPT_FIELD_MAX_CHARS) -> str:
+    """Render a patient field as the prompt would, cut to limit characters"""
+    text = str(value)
+    if len(text) <= limit:
+        return text
+    logger.warning("Clipped prompt field %s from %d to %d chars", name, len(text), limit)
+    return text[:limit].rstrip() + "..."
@@ -4,171 +4,623 @@ For advanced medical analysis and report generation
 With fallback analysis when APIs unavailable
 """
 
-import os
-import requests
-import json
-from typing import Dict, Optional
+import asyncio
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+import httpx
+import re
+from typing import Dict, List, Optional, Tuple
 import logging
-from datetime import datetime
+
+from llm_common import (
+    HTTP2_AVAILABLE, MAX_RETRIES, RETRY_STATUS_CODES, RETRYABLE_ERRORS,
+    clip_field, json_dumps, json_loads, retry_delay
+)
+from micro_batch import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
-# API Keys from environment
-GROK_API_KEY = os.getenv("GROK_API_KEY", "")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+try:
+    from sentence_transformers import SentenceTransformer
+    import faiss
+    import numpy as np
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+    logger.warning("sentence-transformers/FAISS not available - semantic cache uses exact bucket matches only")
 
+# API keys, loaded once in config.py
+from config import settings
 
-class GrokAnalyzer:
+# Built once from the frozen settings; every request reuses the same dicts
+_GROK_HEADERS = {
+    "Authorization": f"Bearer {settings.grok_api_key}",
+    "Content-Type": "application/json",
+    "Accept-Encoding": "gzip, deflate"
+}
+_GEMINI_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept-Encoding": "gzip, deflate"
+}
+
+# Constant payload parts, shared (never mutated) by every request
+_GROK_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are an experienced medical triage specialist. Provide thorough but safe assessment. Always err on side of caution."
+}
+_GROK_STATIC = {"model": "grok-2-1212", "temperature": 0.7, "stream": True}
+
+
+@lru_cache(maxsize=None)
+def _gemini_generation_config(max_output_tokens: int) -> Dict:
+    """One generationConfig per token limit in use (report and fused)"""
+    return {"temperature": 0.5, "maxOutputTokens": max_output_tokens}
+
+
+# Timeouts for one upstream call and for a whole patient pipeline
+CONNECT_TIMEOUT = 3  # seconds to establish the connection
+PIPELINE_DEADLINE = 25.0  # seconds one patient's Grok + Gemini calls may take together
+
+# Request bodies at least this large are sent gzip-compressed; prompts repeat
+# section names and formatting heavily, so they shrink several-fold
+GZIP_MIN_BYTES = 1024
+
+# Keep-alive pool shared by both upstreams; with HTTP/2 concurrent calls to
+# the same host multiplex over one connection instead of opening new sockets
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+_client = httpx.Client(http2=HTTP2_AVAILABLE, limits=_LIMITS)
+
+
+def _attempt_timeout(timeout: float, deadline: Optional[float]) -> httpx.Timeout:
+    """The call's own timeout, shrunk to what is left of the pipeline deadline"""
+    if deadline is not None:
+        timeout = max(1.0, min(timeout, deadline - time.monotonic()))
+    return httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+
+
+def _deadline_passed(deadline: Optional[float], delay: float = 0.0) -> bool:
+    return deadline is not None and time.monotonic() + delay >= deadline
+
+
+class CircuitBreaker:
     """
-    Use Grok AI for detailed symptom analysis
-    More advanced than simple heuristics
-    With fallback to local analysis when API unavailable
+    Consecutive-failure breaker for one upstream API
+    After fail_max failures in a row calls go straight to the fallback for
+    reset_timeout seconds; the next call after that is let through as a trial
     """
     
-    GROK_API_URL = "https://api.x.ai/v1/chat/completions"
-    REQUEST_TIMEOUT = 15  # 15 second timeout
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+    
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.fail_max:
+                self._open_until = time.monotonic() + self.reset_timeout
+                logger.warning("%s circuit open for %ss after %s consecutive failures",
+                               self.name, self.reset_timeout, self._failures)
+
+
+_grok_breaker = CircuitBreaker("Grok")
+_gemini_breaker = CircuitBreaker("Gemini")
+
+# Bounded LRU cache of successful API results, keyed by a hash of the inputs
+ANALYSIS_CACHE_SIZE = 1024
+_analysis_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+
+def _cache_key(*parts) -> str:
+    """Canonical sha256 of the request inputs (patient profile, model, ...)"""
+    return hashlib.sha256(json_dumps(parts, sort_keys=True)).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[Dict]:
+    """Return a copy of the cached result, or None on a miss"""
+    with _analysis_cache_lock:
+        result = _analysis_cache.get(key)
+        if result is None:
+            return None
+        _analysis_cache.move_to_end(key)
+    return dict(result)
+
+
+def _cache_put(key: str, result: Dict) -> None:
+    """Store a successful API result, evicting the least recently used entry"""
+    with _analysis_cache_lock:
+        _analysis_cache[key] = dict(result)
+        _analysis_cache.move_to_end(key)
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+
+class SemanticCache:
+    """
+    Reuse Grok analyses across near-duplicate patients (opt-in: SEMANTIC_CACHE_ENABLED)
+    A profile is reduced to (primary symptom, age decade, severity bin, hash of
+    history, medications, allergies and additional symptoms): an exact match on
+    that key is a hit, otherwise the symptom embedding is compared with cached
+    symptoms that share the rest of the key (cosine >= threshold)
+    """
+    
+    MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+    
+    def __init__(
+        self,
+        enabled: bool = True,
+        threshold: float = 0.95,
+        max_entries: int = ANALYSIS_CACHE_SIZE,
+        max_bucket_entries: int = 64
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bucket_entries = max_bucket_entries
+        self._exact: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._buckets: "OrderedDict[Tuple, Tuple]" = OrderedDict()  # key[1:] -> (index, results)
+        self._model = None
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
     
     @staticmethod
-    def analyze_symptoms(patient_profile: Dict) -> Dict:
-        """
-        Use Grok to analyze symptoms comprehensively
-        Falls back to local analysis if API unavailable
-        """
-        
-        # If no API key, use fallback immediately
-        if not GROK_API_KEY:
-            logger.warning("GROK_API_KEY not configured - using fallback analysis")
-            return GrokAnalyzer._fallback_analysis(patient_profile)
-        
-        prompt = f"""
-        You are a medical triage specialist. Analyze this patient:
-        
-        PATIENT INFORMATION:
-        Age: {patient_profile.get('age')}
-        Gender: {patient_profile.get('gender')}
-        Primary Symptom: {patient_profile.get('primary_symptom')}
-        Duration: {patient_profile.get('duration')}
-        Severity (1-10): {patient_profile.get('severity_score')}
-        Medical History: {patient_profile.get('medical_history')}
-        Additional Symptoms: {patient_profile.get('additional_symptoms')}
-        Current Medications: {patient_profile.get('current_medications')}
-        Allergies: {patient_profile.get('allergies')}
-        
-        IMPORTANT GUIDELINES:
-        - This is for TRIAGE ASSESSMENT ONLY, not diagnosis
-        - Be conservative in assessment
-        - Escalate uncertainty to professional care
-        - Do NOT prescribe medications
-        - Focus on red flags and urgency
-        
-        PROVIDE ANALYSIS WITH:
-        
-        1. SYMPTOM ANALYSIS
-           - What could cause these symptoms?
-           - How common is each possibility?
-           - Pattern analysis
-        
-        2. RED FLAGS ASSESSMENT
-           - Emergency signs present?
-           - Serious conditions to rule out?
-           - Vital signs concerns?
-        
-        3. URGENCY DETERMINATION
-           - GREEN: Home care sufficient
-           - YELLOW: See doctor within 24 hours
-           - RED: Immediate emergency care needed
-        
-        4. RECOMMENDED ACTIONS
-           - What to do immediately?
-           - When to seek professional help?
-           - What to monitor?
-           - Self-care suggestions (if appropriate)
-        
-        5. FOLLOW-UP QUESTIONS
-           - Key questions to clarify diagnosis
-           - Information for healthcare provider
-        
-        Format clearly with headers. Be thorough but concise.
-        """
-        
-        headers = {
-            "Authorization": f"Bearer {GROK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "grok-2-1212",
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": "You are an experienced medical triage specialist. Provide thorough but safe assessment. Always err on side of caution."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
-        
+    def _key(patient_profile: Dict) -> Tuple[str, Optional[int], Optional[int], str]:
+        symptom = " ".join(str(patient_profile.get('primary_symptom', '')).lower().split())
         try:
-            logger.info("Calling Grok API for symptom analysis...")
-            response = requests.post(
-                GrokAnalyzer.GROK_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=GrokAnalyzer.REQUEST_TIMEOUT  # Add timeout!
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            analysis = result['choices'][0]['message']['content']
-            
-            logger.info("Grok analysis completed successfully")
-            
-            return {
-                "success": True,
-                "analysis": analysis,
-                "model": "grok-2-1212",
-                "source": "api"
-            }
-        
-        except requests.exceptions.Timeout:
-            logger.error("Grok API timeout - using fallback analysis")
-            return GrokAnalyzer._fallback_analysis(patient_profile)
-        
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Grok API error: {e} - using fallback analysis")
-            return GrokAnalyzer._fallback_analysis(patient_profile)
-        
-        except Exception as e:
-            logger.error(f"Unexpected error in Grok analysis: {e} - using fallback")
-            return GrokAnalyzer._fallback_analysis(patient_profile)
+            age_bucket = int(patient_profile.get('age')) // 10
+        except (TypeError, ValueError):
+            age_bucket = None
+        try:
+            severity = int(patient_profile.get('severity_score'))
+            severity_bucket = 0 if severity <= 3 else 1 if severity <= 6 else 2
+        except (TypeError, ValueError):
+            severity_bucket = None
+        # Never bucketed: a different history, medication or allergy can change the triage
+        context = _cache_key(
+            patient_profile.get('medical_history'),
+            patient_profile.get('current_medications'),
+            patient_profile.get('allergies'),
+            patient_profile.get('additional_symptoms'),
+        )
+        return symptom, age_bucket, severity_bucket, context
     
-    @staticmethod
-    def _fallback_analysis(patient_profile: Dict) -> Dict:
-        """Fallback analysis when API is unavailable"""
-        
-        logger.info("Using fallback Grok analysis (local)")
-        
-        symptom = patient_profile.get('primary_symptom', 'Unknown').lower()
-        severity = patient_profile.get('severity_score', 5)
-        additional = patient_profile.get('additional_symptoms', [])
-        
-        analysis = f"""
+    def _embed(self, text: str):
+        """Symptom embedding; loads the encoder on first use, so async callers run it in a thread"""
+        with self._model_lock:
+            if self._model is None:
+                self._model = SentenceTransformer(self.MODEL_NAME)
+        vector = self._model.encode([text], normalize_embeddings=True)
+        return np.asarray(vector, dtype="float32")
+    
+    def get(self, patient_profile: Dict) -> Optional[Dict]:
+        """Return a copy of a cached analysis for an equivalent patient, or None"""
+        key, result, bucket = self._lookup(patient_profile)
+        if bucket is None:
+            return result
+        return self._search(bucket, self._embed(key[0]))
+    
+    async def get_async(self, patient_profile: Dict) -> Optional[Dict]:
+        """get() with the embedding computed off the event loop"""
+        key, result, bucket = self._lookup(patient_profile)
+        if bucket is None:
+            return result
+        return self._search(bucket, await asyncio.to_thread(self._embed, key[0]))
+    
+    def put(self, patient_profile: Dict, result: Dict) -> None:
+        """Remember a successful analysis under the patient's bucketed key"""
+        key = self._remember(patient_profile, result)
+        if key is not None and SEMANTIC_CACHE_AVAILABLE:
+            self._add(key, self._embed(key[0]), result)
+    
+    async def put_async(self, patient_profile: Dict, result: Dict) -> None:
+        """put() with the embedding computed off the event loop"""
+        key = self._remember(patient_profile, result)
+        if key is not None and SEMANTIC_CACHE_AVAILABLE:
+            self._add(key, await asyncio.to_thread(self._embed, key[0]), result)
+    
+    def _lookup(self, patient_profile: Dict) -> Tuple[Optional[Tuple], Optional[Dict], Optional[Tuple]]:
+        """(key, exact hit, None), or (key, None, bucket) when the bucket is worth an embedding search"""
+        if not self.enabled:
+            return None, None, None
+        key = self._key(patient_profile)
+        with self._lock:
+            result = self._exact.get(key)
+            if result is not None:
+                self._exact.move_to_end(key)
+                return key, dict(result), None
+            bucket = self._buckets.get(key[1:]) if SEMANTIC_CACHE_AVAILABLE else None
+            if bucket is not None:
+                self._buckets.move_to_end(key[1:])
+        return key, None, bucket
+    
+    def _search(self, bucket: Tuple, vector) -> Optional[Dict]:
+        index, results = bucket
+        with self._lock:
+            if index.ntotal == 0:
+                return None
+            scores, ids = index.search(vector, 1)
+            if scores[0][0] >= self.threshold:
+                return dict(results[ids[0][0]])
+        return None
+    
+    def _remember(self, patient_profile: Dict, result: Dict) -> Optional[Tuple]:
+        """Store the exact-key entry; returns the key, or None when the cache is off"""
+        if not self.enabled:
+            return None
+        key = self._key(patient_profile)
+        with self._lock:
+            self._exact[key] = dict(result)
+            self._exact.move_to_end(key)
+            if len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+        return key
+    
+    def _add(self, key: Tuple, vector, result: Dict) -> None:
+        with self._lock:
+            bucket = self._buckets.get(key[1:])
+            if bucket is None:
+                bucket = (faiss.IndexFlatIP(vector.shape[1]), [])
+                self._buckets[key[1:]] = bucket
+                if len(self._buckets) > self.max_entries:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key[1:])
+            index, results = bucket
+            if index.ntotal >= self.max_bucket_entries:
+                # Flat indexes can't evict single vectors - start the bucket over
+                index.reset()
+                results.clear()
+            index.add(vector)
+            results.append(dict(result))
+
+
+_semantic_cache = SemanticCache(enabled=settings.semantic_cache_enabled)
+
+
+def _encode_body(payload: Dict, headers: Dict) -> Tuple[bytes, Dict]:
+    """Serialize a request payload, gzipping it when large enough to be worth it"""
+    body = json_dumps(payload)
+    if len(body) < GZIP_MIN_BYTES:
+        return body, headers
+    return gzip.compress(body, compresslevel=6), {**headers, "Content-Encoding": "gzip"}
+
+
+def _sse_event(line) -> Optional[Dict]:
+    """Decode one server-sent-events line into its JSON payload (None if not data)"""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    return json_loads(data)
+
+
+def _collect_stream(lines, delta_text) -> str:
+    """Accumulate the text fragments of a streamed response as they arrive"""
+    chunks = []
+    for line in lines:
+        event = _sse_event(line)
+        if event is not None:
+            chunks.append(delta_text(event))
+    return "".join(chunks)
+
+
+async def _collect_stream_async(lines, delta_text) -> str:
+    """Async counterpart of _collect_stream for async response bodies"""
+    chunks = []
+    async for line in lines:
+        event = _sse_event(line)
+        if event is not None:
+            chunks.append(delta_text(event))
+    return "".join(chunks)
+
+
+def _is_final_response(response, attempt: int) -> bool:
+    """
+    True when this response is the one to read (raising on an error status),
+    False when its status is transient and another attempt follows
+    """
+    if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+        response.raise_for_status()
+        return True
+    logger.warning("Upstream returned %s - retrying", response.status_code)
+    return False
+
+
+def _connect_failed(attempt: int) -> None:
+    """Called from the except block: re-raise on the last attempt, else log the retry"""
+    if attempt == MAX_RETRIES:
+        raise
+    logger.warning("Upstream connection failed - retrying")
+
+
+def _next_delay(attempt: int, retry_after: Optional[str], deadline: Optional[float]) -> float:
+    """Backoff before the next attempt; raises if waiting would pass the deadline"""
+    delay = retry_delay(attempt, retry_after)
+    if _deadline_passed(deadline, delay):
+        raise httpx.TimeoutException("Pipeline deadline reached before retry")
+    return delay
+
+
+def _stream_post(url: str, headers: Dict, payload: Dict, delta_text, timeout: float,
+                 deadline: Optional[float] = None) -> str:
+    """
+    POST a streaming request on the shared client and return the assembled text
+    Transient statuses and connection failures are retried with backoff;
+    with a deadline, no attempt or retry wait runs past it
+    """
+    body, headers = _encode_body(payload, headers)
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            with _client.stream("POST", url, headers=headers, content=body,
+                                timeout=_attempt_timeout(timeout, deadline)) as response:
+                if _is_final_response(response, attempt):
+                    return _collect_stream(response.iter_lines(), delta_text)
+                retry_after = response.headers.get("Retry-After")
+        except RETRYABLE_ERRORS:
+            _connect_failed(attempt)
+        time.sleep(_next_delay(attempt, retry_after, deadline))
+
+
+async def _stream_post_async(url: str, headers: Dict, payload: Dict, delta_text, timeout: float,
+                             deadline: Optional[float] = None) -> str:
+    """_stream_post on the shared async client; the retry policy is the same"""
+    client = await open_async_session()
+    body, headers = _encode_body(payload, headers)
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            async with client.stream("POST", url, headers=headers, content=body,
+                                     timeout=_attempt_timeout(timeout, deadline)) as response:
+                if _is_final_response(response, attempt):
+                    return await _collect_stream_async(response.aiter_lines(), delta_text)
+                retry_after = response.headers.get("Retry-After")
+        except RETRYABLE_ERRORS:
+            _connect_failed(attempt)
+        await asyncio.sleep(_next_delay(attempt, retry_after, deadline))
+
+
+# Shared async client for the async pipeline (one per event loop)
+_async_client = None
+
+
+async def open_async_session() -> httpx.AsyncClient:
+    """
+    Shared async HTTP client, created on first use by _stream_post_async
+    (and again after close_async_session)
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=_LIMITS)
+    return _async_client
+
+
+async def close_async_session() -> None:
+    """Close the shared async HTTP client; call when the event loop shuts down"""
+    global _async_client
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+
+
+# ============================================================================
+# Prompt templates (compiled once, filled per call with str.format_map)
+# ============================================================================
+
+_GROK_PATIENT_TMPL = """PATIENT INFORMATION:
+Age: {age}
+Gender: {gender}
+Primary Symptom: {primary_symptom}
+Duration: {duration}
+Severity (1-10): {severity_score}
+Medical History: {medical_history}
+Additional Symptoms: {additional_symptoms}
+Current Medications: {current_medications}
+Allergies: {allergies}
+"""
+
+_GROK_INSTRUCTIONS = """
+IMPORTANT GUIDELINES:
+- This is for TRIAGE ASSESSMENT ONLY, not diagnosis
+- Be conservative in assessment
+- Escalate uncertainty to professional care
+- Do NOT prescribe medications
+- Focus on red flags and urgency
+
+PROVIDE ANALYSIS WITH:
+
+1. SYMPTOM ANALYSIS
+   - What could cause these symptoms?
+   - How common is each possibility?
+   - Pattern analysis
+
+2. RED FLAGS ASSESSMENT
+   - Emergency signs present?
+   - Serious conditions to rule out?
+   - Vital signs concerns?
+
+3. URGENCY DETERMINATION
+   - GREEN: Home care sufficient
+   - YELLOW: See doctor within 24 hours
+   - RED: Immediate emergency care needed
+
+4. RECOMMENDED ACTIONS
+   - What to do immediately?
+   - When to seek professional help?
+   - What to monitor?
+   - Self-care suggestions (if appropriate)
+
+5. FOLLOW-UP QUESTIONS
+   - Key questions to clarify diagnosis
+   - Information for healthcare provider
+
+Format clearly with headers. Be thorough but concise.
+"""
+
+_GROK_PROMPT_TMPL = """
+You are a medical triage specialist. Analyze this patient:
+
+""" + _GROK_PATIENT_TMPL + _GROK_INSTRUCTIONS
+
+# Several patients in one JSON-mode request (BatchingAnalyzer(combine=True))
+_GROK_BATCH_PROMPT_TMPL = """
+You are a medical triage specialist. Analyze each of the {count} patients below
+independently, applying the guidelines and sections to every patient.
+
+{patients}{instructions}
+Respond with a JSON object of the form {{"analyses": ["<analysis of patient 1>", ...]}}
+containing exactly {count} strings, in the same order as the patients.
+"""
+
+_REPORT_DISCLAIMER = """IMPORTANT MEDICAL DISCLAIMER
+===========================
+This assessment is for triage guidance only.
+It is NOT a medical diagnosis.
+It does NOT replace professional medical evaluation.
+Always consult qualified healthcare professionals.
+In emergencies, CALL 911 IMMEDIATELY.
+===========================
+"""
+
+# Report layout shared by the two-step Gemini prompt and the fused prompt
+_REPORT_FORMAT = """
+==========================================
+CREATE REPORT WITH EXACT FORMAT:
+==========================================
+
+HEALTHMATE TRIAGE ASSESSMENT REPORT
+Generated: {generated}
+
+PATIENT INFORMATION
+- Age: {age}
+- Gender: {gender}
+
+CHIEF COMPLAINT
+{primary_symptom}
+
+SYMPTOM ASSESSMENT
+[Symptoms reviewed from Grok analysis]
+
+TRIAGE SEVERITY LEVEL
+{urgency}
+
+CLINICAL OBSERVATIONS
+[Key findings, patterns, red flags]
+
+IMMEDIATE RECOMMENDATIONS
+[What to do right now based on severity]
+
+WHEN TO SEEK EMERGENCY CARE
+[Red flag symptoms that warrant 911]
+
+HOME CARE SUGGESTIONS
+[If appropriate for severity level]
+
+WHAT TO TELL YOUR HEALTHCARE PROVIDER
+[Key information from assessment]
+
+""" + _REPORT_DISCLAIMER
+
+_GEMINI_PROMPT_TMPL = """
+Generate a professional TRIAGE ASSESSMENT REPORT (not a diagnosis):
+
+PATIENT DEMOGRAPHICS:
+- Age: {age}
+- Gender: {gender}
+
+CHIEF COMPLAINT:
+{primary_symptom}
+
+GROK AI ANALYSIS:
+{grok_analysis}
+
+ASSESSED URGENCY LEVEL: {urgency}
+""" + _REPORT_FORMAT
+
+# Single-call variant: Grok-style analysis and the report from one Gemini request
+_FUSED_REPORT_SENTINEL = "=== REPORT ==="
+
+_FUSED_PROMPT_TMPL = _GROK_PROMPT_TMPL + """
+After the analysis, write a line containing only """ + _FUSED_REPORT_SENTINEL + """
+and then a professional TRIAGE ASSESSMENT REPORT (not a diagnosis).
+
+ASSESSED URGENCY LEVEL: {urgency}
+""" + _REPORT_FORMAT
+
+# Fan-out variant: Gemini writes the sections that only depend on the profile
+# and urgency while Grok runs; the Grok analysis is then spliced in locally
+_SECTIONS_PROMPT_TMPL = """
+Write these sections of a professional TRIAGE ASSESSMENT REPORT (not a diagnosis)
+for the patient below. Use exactly these headings, in this order, and nothing else:
+
+IMMEDIATE RECOMMENDATIONS
+WHEN TO SEEK EMERGENCY CARE
+HOME CARE SUGGESTIONS
+WHAT TO TELL YOUR HEALTHCARE PROVIDER
+
+PATIENT:
+- Age: {age}
+- Gender: {gender}
+- Primary Symptom: {primary_symptom}
+- Duration: {duration}
+- Severity (1-10): {severity_score}
+
+ASSESSED URGENCY LEVEL: {urgency}
+"""
+
+_MERGED_REPORT_TMPL = """
+HEALTHMATE TRIAGE ASSESSMENT REPORT
+Generated: {generated}
+
+PATIENT INFORMATION
+- Age: {age}
+- Gender: {gender}
+
+CHIEF COMPLAINT
+{primary_symptom}
+
+TRIAGE SEVERITY LEVEL
+{urgency}
+
+SYMPTOM ASSESSMENT
+{grok_analysis}
+
+{sections}
+
+""" + _REPORT_DISCLAIMER
+
+_GROK_FALLBACK_TMPL = """
 SYMPTOM ANALYSIS
 ================
-Primary Symptom: {patient_profile.get('primary_symptom', 'Not specified')}
+Primary Symptom: {primary_symptom}
 Severity Level: {severity}/10
-Duration: {patient_profile.get('duration', 'Not specified')}
-Additional Symptoms: {', '.join(additional) if additional else 'None reported'}
+Duration: {duration}
+Additional Symptoms: {additional}
 
 MEDICAL HISTORY & RISK FACTORS
 =============================
-Medical History: {patient_profile.get('medical_history', {})}
-Current Medications: {', '.join(patient_profile.get('current_medications', [])) or 'None'}
-Known Allergies: {', '.join(patient_profile.get('allergies', [])) or 'None'}
+Medical History: {medical_history}
+Current Medications: {medications}
+Known Allergies: {allergies}
 
 CLINICAL ASSESSMENT
 ===================
@@ -194,7 +646,7 @@ Based on severity score of {severity}/10:
 - Scores 4-6: YELLOW - Professional evaluation recommended soon
 - Scores 7-10: RED - Urgent/Emergency evaluation needed
 
-Your reported severity of {severity}/10 suggests: {"YELLOW - See healthcare provider soon" if 4 <= severity <= 6 else ("RED - Seek immediate medical attention" if severity > 6 else "GREEN - Monitor at home")}
+Your reported severity of {severity}/10 suggests: {urgency_suggestion}
 
 RECOMMENDED ACTIONS
 ==================
@@ -232,6 +684,472 @@ This is a TRIAGE ASSESSMENT ONLY, generated without real-time API access.
 It is NOT a medical diagnosis or substitute for professional medical evaluation.
 Always consult qualified healthcare professionals for proper assessment and treatment.
 """
+
+
+# Urgency banner shown in the fallback report's recommendations section
+_URGENCY_BANNER = {
+    "yellow": "⚠️  YELLOW - URGENT MEDICAL EVALUATION RECOMMENDED",
+    "red": "🔴 RED - EMERGENCY MEDICAL EVALUATION NEEDED",
+    "green": "🟢 GREEN - HOME CARE MONITORING APPROPRIATE",
+}
+
+
+# Fallback report sections with no per-patient fields, built once at import
+_REPORT_RULE = "=" * 70
+
+_FALLBACK_REPORT_BODY = """ASSESSMENT BASIS
+================
+This triage assessment is based on:
+1. Patient-reported symptoms and severity
+2. Duration and pattern of symptoms
+3. Medical history and risk factors
+4. Associated symptoms and signs
+5. General medical triage principles
+
+CLINICAL OBSERVATIONS
+=====================
+Key Assessment Points:
+- Primary symptom clearly documented
+- Severity level recorded
+- Associated symptoms noted
+- Medical risk factors identified
+- Timeline of symptom onset documented
+
+DIFFERENTIAL CONSIDERATIONS
+===========================
+Based on reported symptoms, the following conditions should be considered:
+- Multiple possible etiologies based on symptom pattern
+- Professional medical evaluation essential for definitive diagnosis
+- Specialist consultation may be appropriate depending on findings
+- Further diagnostic testing likely needed
+
+IMMEDIATE RECOMMENDATIONS
+==========================
+"""
+
+_FALLBACK_REPORT_TAIL = """Actions to take:
+1. Contact your primary healthcare provider for evaluation
+2. If unable to reach regular doctor, visit urgent care clinic
+3. For RED level symptoms, call 911 or go to nearest emergency room
+4. Do not delay care if symptoms worsen
+5. Seek immediate emergency care for any red flag symptoms
+
+WHEN TO SEEK EMERGENCY CARE (CALL 911)
+======================================
+Seek immediate emergency care if experiencing:
+- Chest pain or chest pressure
+- Severe difficulty breathing or shortness of breath
+- Loss of consciousness or severe dizziness
+- Severe allergic reactions
+- Uncontrolled bleeding
+- Symptoms of stroke (facial drooping, arm weakness, slurred speech)
+- Severe abdominal pain
+- Seizures or uncontrolled shaking
+- Severe trauma or injuries
+- Any life-threatening emergency situation
+
+HOME CARE SUGGESTIONS (IF APPROPRIATE)
+======================================
+For lower-acuity situations:
+- Rest: Allow your body adequate time to recover
+- Hydration: Drink plenty of water and clear fluids
+- Nutrition: Eat light, easily digestible foods if tolerated
+- Comfort measures: Use appropriate temperature comfort
+- Monitor: Track symptom changes and progression
+- Avoid: Strenuous activity, alcohol, and problematic foods
+- Document: Note when symptoms started and any triggers
+
+WHAT TO TELL YOUR HEALTHCARE PROVIDER
+=====================================
+When you see a healthcare professional, share:
+1. Exact location and description of primary symptom
+2. When the symptom first started
+3. How symptoms have progressed or changed
+4. Any triggering or relieving factors
+5. Associated symptoms you're experiencing
+6. Complete medical history as listed above
+7. All current medications and dosages
+8. Any known drug allergies
+9. Recent travels, exposures, or illnesses
+10. Impact on your daily activities
+
+IMPORTANT MEDICAL DISCLAIMER
+============================
+⚠️  CRITICAL LEGAL AND MEDICAL NOTICE:
+
+This triage assessment is FOR GUIDANCE ONLY and is intended to help you
+understand your symptoms and determine the urgency of seeking professional care.
+
+THIS ASSESSMENT:
+- IS NOT a medical diagnosis
+- IS NOT a substitute for professional medical evaluation
+- CANNOT replace consultation with healthcare professionals
+- DOES NOT authorize self-treatment or self-medication
+- IS NOT appropriate for emergency situations (call 911)
+
+LIMITATIONS:
+- Based on information you provided, which may be incomplete or inaccurate
+- Cannot perform physical examination
+- Cannot order or interpret diagnostic tests
+- Cannot definitively determine underlying causes
+- May not capture all relevant medical information
+
+WHAT YOU SHOULD DO:
+- Always consult qualified healthcare professionals for proper evaluation
+- Do not delay seeking medical care based on this assessment
+- Seek emergency care immediately for serious symptoms
+- Use this assessment to help communicate with your healthcare provider
+- In case of emergency, CALL 911 IMMEDIATELY
+
+LEGAL RESPONSIBILITY:
+The responsibility for medical decisions rests with you and your healthcare providers.
+This assessment provider makes no warranty as to accuracy or completeness.
+Use at your own discretion and risk.
+
+""" + f"{_REPORT_RULE}\nEND OF TRIAGE ASSESSMENT REPORT\n{_REPORT_RULE}\n"
+
+
+# Section headings in Grok output: "## 2. RED FLAGS", "**Urgency:**", "RED FLAG ASSESSMENT"
+_SECTION_HEADER_RE = re.compile(
+    r"^\s*(?P<hashes>#{1,6}\s*)?(?P<bold>\*\*)?(?:\d+[.)]\s+)?(?:\*\*)?"
+    r"(?P<title>[A-Za-z][\w &/'()-]*?)\**:?\**\s*$"
+)
+_KEY_SECTION_RE = re.compile(r"RED FLAG|URGENCY|RECOMMENDED ACTION", re.IGNORECASE)
+
+
+def _is_section_header(match) -> bool:
+    """Markdown/bold headings always count; a bare line must be multi-word upper case"""
+    if match.group("hashes") or match.group("bold"):
+        return True
+    title = match.group("title")
+    return title.isupper() and (" " in title or bool(_KEY_SECTION_RE.search(title)))
+
+
+def _extract_key_sections(analysis: str) -> str:
+    """
+    Keep only the red-flag, urgency and recommended-action sections of an analysis
+    Used to shrink the Grok text embedded in the Gemini prompt; returns the
+    analysis unchanged when no section headings are recognised
+    """
+    kept = []
+    keep = None
+    for line in analysis.splitlines():
+        match = _SECTION_HEADER_RE.match(line)
+        if match and _is_section_header(match):
+            keep = bool(_KEY_SECTION_RE.search(match.group("title")))
+        if keep:
+            kept.append(line)
+    return "\n".join(kept).strip() if kept else analysis
+
+
+def _csv(items, empty: str = 'None') -> str:
+    """Comma-join a profile list, or return the placeholder without joining when empty"""
+    return ', '.join(items) if items else empty
+
+
+def _template_fields(patient_profile: Dict) -> defaultdict:
+    """Profile view for format_map - missing fields render as 'Not specified'"""
+    return defaultdict(lambda: "Not specified", patient_profile)
+
+
+def _prompt_fields(patient_profile: Dict) -> defaultdict:
+    """_template_fields for LLM prompts, with every profile field clipped"""
+    return defaultdict(
+        lambda: "Not specified",
+        {name: clip_field(name, value) for name, value in patient_profile.items()}
+    )
+
+
+@lru_cache(maxsize=1)
+def _format_timestamp(second: int) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+
+
+def _timestamp() -> str:
+    """Local 'YYYY-MM-DD HH:MM:SS', formatted at most once per second"""
+    return _format_timestamp(int(time.time()))
+
+
+class GrokAnalyzer:
+    """
+    Use Grok AI for detailed symptom analysis
+    More advanced than simple heuristics
+    With fallback to local analysis when API unavailable
+    """
+    
+    GROK_API_URL = "https://api.x.ai/v1/chat/completions"
+    REQUEST_TIMEOUT = 15  # 15 second timeout
+    MAX_TOKENS = 1200  # Enough for the five-section analysis; bounds latency
+    
+    @staticmethod
+    def analyze_symptoms(patient_profile: Dict, deadline: Optional[float] = None) -> Dict:
+        """
+        Use Grok to analyze symptoms comprehensively
+        Falls back to local analysis if API unavailable
+        """
+        
+        result, cache_key = GrokAnalyzer._precheck(patient_profile)
+        if result is None:
+            similar = _semantic_cache.get(patient_profile)
+            result = GrokAnalyzer._skip_call(patient_profile, similar, deadline)
+        if result is not None:
+            return result
+        
+        headers, payload = GrokAnalyzer._build_request(patient_profile)
+        
+        try:
+            logger.info("Calling Grok API for symptom analysis...")
+            analysis = GrokAnalyzer._post(headers, payload, deadline)
+            result = GrokAnalyzer._parse_response(analysis)
+        except Exception as e:
+            return GrokAnalyzer._call_failed(patient_profile, e)
+        
+        GrokAnalyzer._call_succeeded(cache_key, result)
+        _semantic_cache.put(patient_profile, result)
+        return result
+    
+    @staticmethod
+    async def analyze_symptoms_async(patient_profile: Dict, deadline: Optional[float] = None) -> Dict:
+        """
+        analyze_symptoms on the shared async client
+        Lets Grok calls for concurrent patients overlap instead of serializing
+        """
+        
+        result, cache_key = GrokAnalyzer._precheck(patient_profile)
+        if result is None:
+            similar = await _semantic_cache.get_async(patient_profile)
+            result = GrokAnalyzer._skip_call(patient_profile, similar, deadline)
+        if result is not None:
+            return result
+        
+        headers, payload = GrokAnalyzer._build_request(patient_profile)
+        
+        try:
+            logger.info("Calling Grok API for symptom analysis (async)...")
+            analysis = await GrokAnalyzer._post_async(headers, payload, deadline)
+            result = GrokAnalyzer._parse_response(analysis)
+        except Exception as e:
+            return GrokAnalyzer._call_failed(patient_profile, e)
+        
+        GrokAnalyzer._call_succeeded(cache_key, result)
+        await _semantic_cache.put_async(patient_profile, result)
+        return result
+    
+    @staticmethod
+    def _precheck(patient_profile: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Checks shared by the sync and async analyzers, before any cache lookup
+        that may block: (fallback or cached result, None), or (None, cache key)
+        """
+        
+        # If no API key, use fallback immediately
+        if not settings.grok_api_key:
+            logger.warning("GROK_API_KEY not configured - using fallback analysis")
+            return GrokAnalyzer._fallback_analysis(patient_profile), None
+        
+        # Nothing to analyze - don't spend a round-trip on it
+        if not patient_profile.get('primary_symptom'):
+            logger.warning("No primary symptom provided - using fallback analysis")
+            return GrokAnalyzer._fallback_analysis(patient_profile), None
+        
+        cache_key = _cache_key("grok", patient_profile)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info("Grok analysis served from cache")
+            return cached, None
+        
+        return None, cache_key
+    
+    @staticmethod
+    def _skip_call(
+        patient_profile: Dict,
+        similar: Optional[Dict],
+        deadline: Optional[float]
+    ) -> Optional[Dict]:
+        """Result to use instead of calling Grok (semantic hit, open circuit, no time left), or None"""
+        
+        if similar is not None:
+            logger.info("Grok analysis served from semantic cache")
+            return similar
+        
+        if _grok_breaker.is_open():
+            logger.warning("Grok circuit open - using fallback analysis")
+            return GrokAnalyzer._fallback_analysis(patient_profile)
+        
+        if _deadline_passed(deadline):
+            logger.warning("Pipeline deadline reached - using fallback analysis")
+            return GrokAnalyzer._fallback_analysis(patient_profile)
+        
+        return None
+    
+    @staticmethod
+    def _call_succeeded(cache_key: str, result: Dict) -> None:
+        _grok_breaker.record_success()
+        _cache_put(cache_key, result)
+    
+    @staticmethod
+    def _call_failed(patient_profile: Dict, error: Exception) -> Dict:
+        """Count the failure against the breaker and return the fallback analysis"""
+        
+        _grok_breaker.record_failure()
+        if isinstance(error, httpx.TimeoutException):
+            logger.error("Grok API timeout - using fallback analysis")
+        elif isinstance(error, httpx.HTTPError):
+            logger.error("Grok API error: %s - using fallback analysis", error)
+        else:
+            logger.error("Unexpected error in Grok analysis: %s - using fallback", error)
+        return GrokAnalyzer._fallback_analysis(patient_profile)
+    
+    @staticmethod
+    async def analyze_batch_async(patient_profiles: List[Dict]) -> List[Dict]:
+        """
+        Analyze several patients with one JSON-mode Grok call
+        Profiles that are cached or can't use the API, and everything the combined
+        response fails to cover, go through analyze_symptoms_async individually
+        """
+        
+        results: List[Optional[Dict]] = [None] * len(patient_profiles)
+        pending = [
+            i for i, profile in enumerate(patient_profiles)
+            if settings.grok_api_key and profile.get('primary_symptom')
+            and _cache_get(_cache_key("grok", profile)) is None
+        ]
+        
+        if len(pending) > 1 and not _grok_breaker.is_open():
+            headers, payload = GrokAnalyzer._build_batch_request([patient_profiles[i] for i in pending])
+            try:
+                logger.info("Calling Grok API for %s patients in one request...", len(pending))
+                text = await _stream_post_async(GrokAnalyzer.GROK_API_URL, headers, payload,
+                                                GrokAnalyzer._delta_text, GrokAnalyzer.REQUEST_TIMEOUT)
+                analyses = GrokAnalyzer._split_batch_response(text, len(pending))
+                _grok_breaker.record_success()
+                for i, analysis in zip(pending, analyses):
+                    result = GrokAnalyzer._parse_response(analysis)
+                    _cache_put(_cache_key("grok", patient_profiles[i]), result)
+                    await _semantic_cache.put_async(patient_profiles[i], result)
+                    results[i] = result
+            
+            except ValueError as e:
+                logger.error("Unusable combined Grok response: %s - analyzing individually", e)
+            
+            except Exception as e:
+                _grok_breaker.record_failure()
+                logger.error("Combined Grok call failed: %s - analyzing individually", e)
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        singles = await asyncio.gather(*[
+            GrokAnalyzer.analyze_symptoms_async(patient_profiles[i]) for i in missing
+        ])
+        for i, result in zip(missing, singles):
+            results[i] = result
+        
+        return results
+    
+    @staticmethod
+    def _split_batch_response(text: str, count: int) -> List[str]:
+        """Recover the per-patient analyses from a combined JSON response"""
+        
+        data = json_loads(text)
+        analyses = data.get("analyses") if isinstance(data, dict) else None
+        if (not isinstance(analyses, list) or len(analyses) != count
+                or not all(isinstance(a, str) and a.strip() for a in analyses)):
+            raise ValueError(f"expected {count} analyses in the combined Grok response")
+        return analyses
+    
+    @staticmethod
+    def _build_request(patient_profile: Dict) -> Tuple[Dict, Dict]:
+        """Build headers and payload shared by the sync and async callers"""
+        
+        prompt = _GROK_PROMPT_TMPL.format_map(_prompt_fields(patient_profile))
+        
+        headers = _GROK_HEADERS
+        payload = GrokAnalyzer._payload(prompt, GrokAnalyzer.MAX_TOKENS)
+        
+        return headers, payload
+    
+    @staticmethod
+    def _build_batch_request(patient_profiles: List[Dict]) -> Tuple[Dict, Dict]:
+        """Build headers and a JSON-mode payload covering several patients"""
+        
+        patients = "\n".join(
+            f"--- PATIENT {i} ---\n" + _GROK_PATIENT_TMPL.format_map(_prompt_fields(profile))
+            for i, profile in enumerate(patient_profiles, 1)
+        )
+        prompt = _GROK_BATCH_PROMPT_TMPL.format(
+            count=len(patient_profiles),
+            patients=patients,
+            instructions=_GROK_INSTRUCTIONS
+        )
+        
+        headers = _GROK_HEADERS
+        payload = GrokAnalyzer._payload(prompt, GrokAnalyzer.MAX_TOKENS * len(patient_profiles))
+        payload["response_format"] = {"type": "json_object"}
+        
+        return headers, payload
+    
+    @staticmethod
+    def _payload(prompt: str, max_tokens: int) -> Dict:
+        return {
+            **_GROK_STATIC,
+            "messages": [_GROK_SYSTEM_MSG, {"role": "user", "content": prompt}],
+            "max_tokens": max_tokens
+        }
+    
+    @staticmethod
+    def _post(headers: Dict, payload: Dict, deadline: Optional[float] = None) -> str:
+        """POST the streaming chat completion and return the assembled text"""
+        return _stream_post(GrokAnalyzer.GROK_API_URL, headers, payload,
+                            GrokAnalyzer._delta_text, GrokAnalyzer.REQUEST_TIMEOUT, deadline)
+    
+    @staticmethod
+    async def _post_async(headers: Dict, payload: Dict, deadline: Optional[float] = None) -> str:
+        """Async _post on the shared async client"""
+        return await _stream_post_async(GrokAnalyzer.GROK_API_URL, headers, payload,
+                                        GrokAnalyzer._delta_text, GrokAnalyzer.REQUEST_TIMEOUT, deadline)
+    
+    @staticmethod
+    def _delta_text(event: Dict) -> str:
+        """Text fragment carried by one streamed chat-completion chunk"""
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
+    
+    @staticmethod
+    def _parse_response(analysis: str) -> Dict:
+        """Wrap the streamed Grok analysis text in the analyzer result"""
+        
+        if not analysis:
+            raise ValueError("Grok returned an empty analysis")
+        
+        logger.info("Grok analysis completed successfully")
+        
+        return {
+            "success": True,
+            "analysis": analysis,
+            "model": "grok-2-1212",
+            "source": "api"
+        }
+    
+    @staticmethod
+    def _fallback_analysis(patient_profile: Dict) -> Dict:
+        """Fallback analysis when API is unavailable"""
+        
+        logger.info("Using fallback Grok analysis (local)")
+        
+        severity = patient_profile.get('severity_score', 5)
+        
+        analysis = _GROK_FALLBACK_TMPL.format_map({
+            "primary_symptom": patient_profile.get('primary_symptom', 'Not specified'),
+            "severity": severity,
+            "duration": patient_profile.get('duration', 'Not specified'),
+            "additional": _csv(patient_profile.get('additional_symptoms', ()), 'None reported'),
+            "medical_history": patient_profile.get('medical_history', {}),
+            "medications": _csv(patient_profile.get('current_medications', ())),
+            "allergies": _csv(patient_profile.get('allergies', ())),
+            "urgency_suggestion": (
+                "YELLOW - See healthcare provider soon" if 4 <= severity <= 6
+                else ("RED - Seek immediate medical attention" if severity > 6 else "GREEN - Monitor at home")
+            ),
+        })
         
         return {
             "success": True,
@@ -249,89 +1167,264 @@ class GeminiReportGenerator:
     """
     
     GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+    GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent"
     REQUEST_TIMEOUT = 15  # 15 second timeout
+    MAX_OUTPUT_TOKENS = 1500  # Enough for the report format; bounds latency
+    FUSED_MAX_OUTPUT_TOKENS = GrokAnalyzer.MAX_TOKENS + MAX_OUTPUT_TOKENS  # Analysis + report
     
     @staticmethod
     def generate_final_report(
         patient_profile: Dict,
         grok_analysis: str,
-        urgency_level: str
+        urgency_level: str,
+        deadline: Optional[float] = None
     ) -> Dict:
         """
         Use Gemini to create professional triage report
         Falls back to local report generation if API unavailable
         """
         
+        result, cache_key = GeminiReportGenerator._precheck(
+            patient_profile, grok_analysis, urgency_level, deadline
+        )
+        if result is not None:
+            return result
+        
+        headers, payload = GeminiReportGenerator._build_request(
+            patient_profile, grok_analysis, urgency_level
+        )
+        
+        try:
+            logger.info("Calling Gemini API for report generation...")
+            report = GeminiReportGenerator._post(headers, payload, deadline)
+            result = GeminiReportGenerator._parse_response(report)
+        except Exception as e:
+            return GeminiReportGenerator._call_failed(patient_profile, grok_analysis, urgency_level, e)
+        
+        _gemini_breaker.record_success()
+        _cache_put(cache_key, result)
+        return result
+    
+    @staticmethod
+    async def generate_static_sections_async(patient_profile: Dict, urgency_level: str) -> Optional[str]:
+        """
+        Have Gemini write the report sections that don't depend on the Grok analysis
+        Runs concurrently with Grok; returns None when unavailable or failed
+        """
+        
+        if not settings.gemini_api_key or not patient_profile.get('primary_symptom'):
+            return None
+        
+        cache_key = _cache_key("sections", patient_profile, urgency_level)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info("Gemini report sections served from cache")
+            return cached["sections"]
+        
+        if _gemini_breaker.is_open():
+            logger.warning("Gemini circuit open - skipping report sections")
+            return None
+        
+        fields = _prompt_fields(patient_profile)
+        fields["urgency"] = urgency_level.upper()
+        prompt = _SECTIONS_PROMPT_TMPL.format_map(fields)
+        payload = GeminiReportGenerator._payload(prompt, GeminiReportGenerator.MAX_OUTPUT_TOKENS)
+        
+        try:
+            logger.info("Calling Gemini API for report sections (async)...")
+            sections = (await GeminiReportGenerator._post_async(_GEMINI_HEADERS, payload)).strip()
+            if not sections:
+                raise ValueError("Gemini returned empty report sections")
+            _gemini_breaker.record_success()
+            _cache_put(cache_key, {"sections": sections})
+            return sections
+        
+        except Exception as e:
+            _gemini_breaker.record_failure()
+            logger.error("Gemini report sections failed: %s", e)
+            return None
+    
+    @staticmethod
+    def merge_narrative(
+        patient_profile: Dict,
+        grok_analysis: str,
+        urgency_level: str,
+        sections: str
+    ) -> Dict:
+        """Compose the final report from the Grok analysis and the pre-written sections"""
+        
+        fields = _template_fields(patient_profile)
+        fields["grok_analysis"] = grok_analysis.strip()
+        fields["urgency"] = urgency_level.upper()
+        fields["generated"] = _timestamp()
+        fields["sections"] = sections
+        
+        return {
+            "success": True,
+            "report": _MERGED_REPORT_TMPL.format_map(fields),
+            "model": "gemini-pro",
+            "source": "api"
+        }
+    
+    @staticmethod
+    async def generate_final_report_async(
+        patient_profile: Dict,
+        grok_analysis: str,
+        urgency_level: str,
+        deadline: Optional[float] = None
+    ) -> Dict:
+        """
+        generate_final_report on the shared async client
+        """
+        
+        result, cache_key = GeminiReportGenerator._precheck(
+            patient_profile, grok_analysis, urgency_level, deadline
+        )
+        if result is not None:
+            return result
+        
+        headers, payload = GeminiReportGenerator._build_request(
+            patient_profile, grok_analysis, urgency_level
+        )
+        
+        try:
+            logger.info("Calling Gemini API for report generation (async)...")
+            report = await GeminiReportGenerator._post_async(headers, payload, deadline)
+            result = GeminiReportGenerator._parse_response(report)
+        except Exception as e:
+            return GeminiReportGenerator._call_failed(patient_profile, grok_analysis, urgency_level, e)
+        
+        _gemini_breaker.record_success()
+        _cache_put(cache_key, result)
+        return result
+    
+    @staticmethod
+    def _precheck(
+        patient_profile: Dict,
+        grok_analysis: str,
+        urgency_level: str,
+        deadline: Optional[float]
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Checks shared by the sync and async report calls:
+        (fallback or cached report, None), or (None, cache key) to call Gemini
+        """
+        
         # If no API key, use fallback immediately
-        if not GEMINI_API_KEY:
+        if not settings.gemini_api_key:
             logger.warning("GEMINI_API_KEY not configured - using fallback report")
-            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level)
+            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level), None
         
-        prompt = f"""
-        Generate a professional TRIAGE ASSESSMENT REPORT (not a diagnosis):
+        # Without an analysis there is nothing for Gemini to summarize
+        if not grok_analysis:
+            logger.warning("Empty Grok analysis - using fallback report")
+            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level), None
         
-        PATIENT DEMOGRAPHICS:
-        - Age: {patient_profile.get('age')}
-        - Gender: {patient_profile.get('gender')}
+        cache_key = _cache_key("gemini", patient_profile, grok_analysis, urgency_level)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info("Gemini report served from cache")
+            return cached, None
         
-        CHIEF COMPLAINT:
-        {patient_profile.get('primary_symptom')}
+        if _gemini_breaker.is_open():
+            logger.warning("Gemini circuit open - using fallback report")
+            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level), None
         
-        GROK AI ANALYSIS:
-        {grok_analysis}
+        if _deadline_passed(deadline):
+            logger.warning("Pipeline deadline reached - using fallback report")
+            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level), None
         
-        ASSESSED URGENCY LEVEL: {urgency_level.upper()}
+        return None, cache_key
+    
+    @staticmethod
+    def _call_failed(patient_profile: Dict, grok_analysis: str, urgency_level: str, error: Exception) -> Dict:
+        """Count the failure against the breaker and return the fallback report"""
         
-        ==========================================
-        CREATE REPORT WITH EXACT FORMAT:
-        ==========================================
+        _gemini_breaker.record_failure()
+        if isinstance(error, httpx.TimeoutException):
+            logger.error("Gemini API timeout - using fallback report")
+        elif isinstance(error, httpx.HTTPError):
+            logger.error("Gemini API error: %s - using fallback report", error)
+        else:
+            logger.error("Unexpected error in Gemini report: %s", error)
+        return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level)
+    
+    @staticmethod
+    def generate_fused(patient_profile: Dict, urgency_level: str) -> Optional[Dict]:
+        """
+        Have Gemini write both the symptom analysis and the final report in one call
+        Returns None when the call is unavailable or fails so the caller can
+        fall back to the two-model pipeline
+        """
         
-        HEALTHMATE TRIAGE ASSESSMENT REPORT
-        Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        if not settings.gemini_api_key or not patient_profile.get('primary_symptom'):
+            return None
         
-        PATIENT INFORMATION
-        - Age: {patient_profile.get('age')}
-        - Gender: {patient_profile.get('gender')}
+        cache_key = _cache_key("fused", patient_profile, urgency_level)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info("Gemini fused result served from cache")
+            return cached
         
-        CHIEF COMPLAINT
-        {patient_profile.get('primary_symptom')}
+        if _gemini_breaker.is_open():
+            logger.warning("Gemini circuit open - skipping fused call")
+            return None
         
-        SYMPTOM ASSESSMENT
-        [Symptoms reviewed from Grok analysis]
+        headers, payload = GeminiReportGenerator._build_fused_request(patient_profile, urgency_level)
         
-        TRIAGE SEVERITY LEVEL
-        {urgency_level.upper()}
+        try:
+            logger.info("Calling Gemini API for fused analysis and report...")
+            text = GeminiReportGenerator._post(headers, payload)
+            result = GeminiReportGenerator._parse_fused_response(text)
+            _gemini_breaker.record_success()
+            _cache_put(cache_key, result)
+            return result
         
-        CLINICAL OBSERVATIONS
-        [Key findings, patterns, red flags]
+        except ValueError as e:
+            logger.error("Unusable fused Gemini response: %s - using two-step pipeline", e)
+            return None
         
-        IMMEDIATE RECOMMENDATIONS
-        [What to do right now based on severity]
+        except Exception as e:
+            _gemini_breaker.record_failure()
+            logger.error("Gemini fused call failed: %s - using two-step pipeline", e)
+            return None
+    
+    @staticmethod
+    def _build_request(
+        patient_profile: Dict,
+        grok_analysis: str,
+        urgency_level: str
+    ) -> Tuple[Dict, Dict]:
+        """Build headers and payload shared by the sync and async callers"""
         
-        WHEN TO SEEK EMERGENCY CARE
-        [Red flag symptoms that warrant 911]
+        fields = _prompt_fields(patient_profile)
+        fields["grok_analysis"] = grok_analysis
+        fields["urgency"] = urgency_level.upper()
+        fields["generated"] = _timestamp()
+        prompt = _GEMINI_PROMPT_TMPL.format_map(fields)
         
-        HOME CARE SUGGESTIONS
-        [If appropriate for severity level]
+        headers = _GEMINI_HEADERS
+        payload = GeminiReportGenerator._payload(prompt, GeminiReportGenerator.MAX_OUTPUT_TOKENS)
         
-        WHAT TO TELL YOUR HEALTHCARE PROVIDER
-        [Key information from assessment]
+        return headers, payload
+    
+    @staticmethod
+    def _build_fused_request(patient_profile: Dict, urgency_level: str) -> Tuple[Dict, Dict]:
+        """Build headers and payload for the single-call analysis + report prompt"""
         
-        IMPORTANT MEDICAL DISCLAIMER
-        ===========================
-        This assessment is for triage guidance only.
-        It is NOT a medical diagnosis.
-        It does NOT replace professional medical evaluation.
-        Always consult qualified healthcare professionals.
-        In emergencies, CALL 911 IMMEDIATELY.
-        ===========================
-        """
+        fields = _prompt_fields(patient_profile)
+        fields["urgency"] = urgency_level.upper()
+        fields["generated"] = _timestamp()
+        prompt = _FUSED_PROMPT_TMPL.format_map(fields)
         
-        headers = {
-            "Content-Type": "application/json"
-        }
+        headers = _GEMINI_HEADERS
+        payload = GeminiReportGenerator._payload(prompt, GeminiReportGenerator.FUSED_MAX_OUTPUT_TOKENS)
         
-        payload = {
+        return headers, payload
+    
+    @staticmethod
+    def _payload(prompt: str, max_output_tokens: int) -> Dict:
+        return {
             "contents": [
                 {
                     "parts": [
@@ -339,45 +1432,68 @@ class GeminiReportGenerator:
                     ]
                 }
             ],
-            "generationConfig": {
-                "temperature": 0.5,
-                "maxOutputTokens": 2500,
-            }
+            "generationConfig": _gemini_generation_config(max_output_tokens)
+        }
+    
+    @staticmethod
+    def _post(headers: Dict, payload: Dict, deadline: Optional[float] = None) -> str:
+        """POST the streaming generateContent request and return the assembled text"""
+        return _stream_post(GeminiReportGenerator._stream_url(), headers, payload,
+                            GeminiReportGenerator._delta_text, GeminiReportGenerator.REQUEST_TIMEOUT,
+                            deadline)
+    
+    @staticmethod
+    async def _post_async(headers: Dict, payload: Dict, deadline: Optional[float] = None) -> str:
+        """Async _post on the shared async client"""
+        return await _stream_post_async(GeminiReportGenerator._stream_url(), headers, payload,
+                                        GeminiReportGenerator._delta_text, GeminiReportGenerator.REQUEST_TIMEOUT,
+                                        deadline)
+    
+    @staticmethod
+    def _stream_url() -> str:
+        return f"{GeminiReportGenerator.GEMINI_STREAM_URL}?alt=sse&key={settings.gemini_api_key}"
+    
+    @staticmethod
+    def _delta_text(event: Dict) -> str:
+        """Text fragment carried by one streamed generateContent chunk"""
+        candidates = event.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts") or [{}]
+        return parts[0].get("text") or ""
+    
+    @staticmethod
+    def _parse_response(report: str) -> Dict:
+        """Wrap the streamed Gemini report text in the generator result"""
+        
+        if not report:
+            raise ValueError("Gemini returned an empty report")
+        
+        logger.info("Gemini report generated successfully")
+        
+        return {
+            "success": True,
+            "report": report,
+            "model": "gemini-pro",
+            "source": "api"
         }
+    
+    @staticmethod
+    def _parse_fused_response(text: str) -> Dict:
+        """Split the fused response into the analysis and report at the sentinel line"""
         
-        try:
-            logger.info("Calling Gemini API for report generation...")
-            response = requests.post(
-                f"{GeminiReportGenerator.GEMINI_API_URL}?key={GEMINI_API_KEY}",
-                headers=headers,
-                json=payload,
-                timeout=GeminiReportGenerator.REQUEST_TIMEOUT  # Add timeout!
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            report = result['candidates'][0]['content']['parts'][0]['text']
-            
-            logger.info("Gemini report generated successfully")
-            
-            return {
-                "success": True,
-                "report": report,
-                "model": "gemini-pro",
-                "source": "api"
-            }
-        
-        except requests.exceptions.Timeout:
-            logger.error("Gemini API timeout - using fallback report")
-            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level)
+        analysis, sentinel, report = text.partition(_FUSED_REPORT_SENTINEL)
+        analysis, report = analysis.strip(), report.strip()
+        if not sentinel or not analysis or not report:
+            raise ValueError("Gemini fused response is missing the analysis or the report")
         
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Gemini API error: {e} - using fallback report")
-            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level)
+        logger.info("Gemini fused analysis and report generated successfully")
         
-        except Exception as e:
-            logger.error(f"Unexpected error in Gemini report: {e}")
-            return GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level)
+        return {
+            "success": True,
+            "analysis": analysis,
+            "report": report,
+            "model": "gemini-pro",
+            "source": "api"
+        }
     
     @staticmethod
     def _fallback_report(patient_profile: Dict, grok_analysis: str, urgency_level: str) -> Dict:
@@ -385,166 +1501,71 @@ class GeminiReportGenerator:
         
         logger.info("Using fallback Gemini report (local)")
         
-        report = f"""
-{'='*70}
-HEALTHMATE TRIAGE ASSESSMENT REPORT
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-{'='*70}
-
-PATIENT INFORMATION
-===================
-Age: {patient_profile.get('age', 'Not specified')}
-Gender: {patient_profile.get('gender', 'Not specified')}
-
-CHIEF COMPLAINT
-===============
-{patient_profile.get('primary_symptom', 'Not specified')}
-
-SYMPTOM DURATION
-================
-{patient_profile.get('duration', 'Not specified')}
-
-SEVERITY ASSESSMENT
-===================
-Patient-reported severity: {patient_profile.get('severity_score', 'Not rated')}/10
-
-ADDITIONAL SYMPTOMS
-===================
-{', '.join(patient_profile.get('additional_symptoms', [])) or 'None reported'}
-
-MEDICAL HISTORY
-===============
-{', '.join([k.replace('_', ' ').title() for k, v in patient_profile.get('medical_history', {}).items() if v]) or 'No significant history reported'}
-
-CURRENT MEDICATIONS
-===================
-{', '.join(patient_profile.get('current_medications', [])) or 'None reported'}
-
-KNOWN ALLERGIES
-===============
-{', '.join(patient_profile.get('allergies', [])) or 'No known drug allergies'}
-
-TRIAGE SEVERITY LEVEL
-=====================
-{urgency_level.upper()}
-
-ASSESSMENT BASIS
-================
-This triage assessment is based on:
-1. Patient-reported symptoms and severity
-2. Duration and pattern of symptoms
-3. Medical history and risk factors
-4. Associated symptoms and signs
-5. General medical triage principles
-
-CLINICAL OBSERVATIONS
-=====================
-Key Assessment Points:
-- Primary symptom clearly documented
-- Severity level recorded
-- Associated symptoms noted
-- Medical risk factors identified
-- Timeline of symptom onset documented
-
-DIFFERENTIAL CONSIDERATIONS
-===========================
-Based on reported symptoms, the following conditions should be considered:
-- Multiple possible etiologies based on symptom pattern
-- Professional medical evaluation essential for definitive diagnosis
-- Specialist consultation may be appropriate depending on findings
-- Further diagnostic testing likely needed
-
-IMMEDIATE RECOMMENDATIONS
-==========================
-Based on assessed urgency level of {urgency_level.upper()}:
-
-{"⚠️  YELLOW - URGENT MEDICAL EVALUATION RECOMMENDED\n\n" if urgency_level.lower() == "yellow" else ""}
-{"🔴 RED - EMERGENCY MEDICAL EVALUATION NEEDED\n\n" if urgency_level.lower() == "red" else ""}
-{"🟢 GREEN - HOME CARE MONITORING APPROPRIATE\n\n" if urgency_level.lower() == "green" else ""}
-
-Actions to take:
-1. Contact your primary healthcare provider for evaluation
-2. If unable to reach regular doctor, visit urgent care clinic
-3. For RED level symptoms, call 911 or go to nearest emergency room
-4. Do not delay care if symptoms worsen
-5. Seek immediate emergency care for any red flag symptoms
-
-WHEN TO SEEK EMERGENCY CARE (CALL 911)
-======================================
-Seek immediate emergency care if experiencing:
-- Chest pain or chest pressure
-- Severe difficulty breathing or shortness of breath
-- Loss of consciousness or severe dizziness
-- Severe allergic reactions
-- Uncontrolled bleeding
-- Symptoms of stroke (facial drooping, arm weakness, slurred speech)
-- Severe abdominal pain
-- Seizures or uncontrolled shaking
-- Severe trauma or injuries
-- Any life-threatening emergency situation
-
-HOME CARE SUGGESTIONS (IF APPROPRIATE)
-======================================
-For lower-acuity situations:
-- Rest: Allow your body adequate time to recover
-- Hydration: Drink plenty of water and clear fluids
-- Nutrition: Eat light, easily digestible foods if tolerated
-- Comfort measures: Use appropriate temperature comfort
-- Monitor: Track symptom changes and progression
-- Avoid: Strenuous activity, alcohol, and problematic foods
-- Document: Note when symptoms started and any triggers
-
-WHAT TO TELL YOUR HEALTHCARE PROVIDER
-=====================================
-When you see a healthcare professional, share:
-1. Exact location and description of primary symptom
-2. When the symptom first started
-3. How symptoms have progressed or changed
-4. Any triggering or relieving factors
-5. Associated symptoms you're experiencing
-6. Complete medical history as listed above
-7. All current medications and dosages
-8. Any known drug allergies
-9. Recent travels, exposures, or illnesses
-10. Impact on your daily activities
-
-IMPORTANT MEDICAL DISCLAIMER
-============================
-⚠️  CRITICAL LEGAL AND MEDICAL NOTICE:
-
-This triage assessment is FOR GUIDANCE ONLY and is intended to help you
-understand your symptoms and determine the urgency of seeking professional care.
-
-THIS ASSESSMENT:
-- IS NOT a medical diagnosis
-- IS NOT a substitute for professional medical evaluation
-- CANNOT replace consultation with healthcare professionals
-- DOES NOT authorize self-treatment or self-medication
-- IS NOT appropriate for emergency situations (call 911)
-
-LIMITATIONS:
-- Based on information you provided, which may be incomplete or inaccurate
-- Cannot perform physical examination
-- Cannot order or interpret diagnostic tests
-- Cannot definitively determine underlying causes
-- May not capture all relevant medical information
-
-WHAT YOU SHOULD DO:
-- Always consult qualified healthcare professionals for proper evaluation
-- Do not delay seeking medical care based on this assessment
-- Seek emergency care immediately for serious symptoms
-- Use this assessment to help communicate with your healthcare provider
-- In case of emergency, CALL 911 IMMEDIATELY
-
-LEGAL RESPONSIBILITY:
-The responsibility for medical decisions rests with you and your healthcare providers.
-This assessment provider makes no warranty as to accuracy or completeness.
-Use at your own discretion and risk.
-
-{'='*70}
-END OF TRIAGE ASSESSMENT REPORT
-{'='*70}
-"""
+        # Read every profile field once up front
+        get = patient_profile.get
+        age = get('age', 'Not specified')
+        gender = get('gender', 'Not specified')
+        primary_symptom = get('primary_symptom', 'Not specified')
+        duration = get('duration', 'Not specified')
+        severity = get('severity_score', 'Not rated')
+        additional = _csv(get('additional_symptoms', ()), 'None reported')
+        history = _csv(
+            [k.replace('_', ' ').title() for k, v in get('medical_history', {}).items() if v],
+            'No significant history reported'
+        )
+        medications = _csv(get('current_medications', ()), 'None reported')
+        allergies = _csv(get('allergies', ()), 'No known drug allergies')
+        urgency = urgency_level.upper()
+        banner = _URGENCY_BANNER.get(urgency_level.lower(), "")
+        
+        head = "\n".join((
+            "",
+            _REPORT_RULE,
+            "HEALTHMATE TRIAGE ASSESSMENT REPORT",
+            f"Generated: {_timestamp()}",
+            _REPORT_RULE,
+            "",
+            "PATIENT INFORMATION",
+            "===================",
+            f"Age: {age}",
+            f"Gender: {gender}",
+            "",
+            "CHIEF COMPLAINT",
+            "===============",
+            str(primary_symptom),
+            "",
+            "SYMPTOM DURATION",
+            "================",
+            str(duration),
+            "",
+            "SEVERITY ASSESSMENT",
+            "===================",
+            f"Patient-reported severity: {severity}/10",
+            "",
+            "ADDITIONAL SYMPTOMS",
+            "===================",
+            additional,
+            "",
+            "MEDICAL HISTORY",
+            "===============",
+            history,
+            "",
+            "CURRENT MEDICATIONS",
+            "===================",
+            medications,
+            "",
+            "KNOWN ALLERGIES",
+            "===============",
+            allergies,
+            "",
+            "TRIAGE SEVERITY LEVEL",
+            "=====================",
+            urgency,
+            "",
+            "",
+        ))
+        recommendation = f"Based on assessed urgency level of {urgency}:\n\n{banner}\n\n\n"
+        report = "".join((head, _FALLBACK_REPORT_BODY, recommendation, _FALLBACK_REPORT_TAIL))
         
         return {
             "success": True,
@@ -554,6 +1575,88 @@ END OF TRIAGE ASSESSMENT REPORT
         }
 
 
+class BatchingAnalyzer:
+    """
+    Micro-batcher for concurrent Grok analyses
+    Collects patients arriving within batch_interval (up to batch_max) and
+    dispatches them together; identical profiles in a batch share one call
+    With combine=True the distinct profiles of a batch go out as a single
+    JSON-mode Grok request instead of one request each
+    """
+    
+    def __init__(
+        self,
+        batch_interval: float = 0.05,
+        batch_max: int = 8,
+        max_in_flight: int = 50,
+        combine: bool = False
+    ):
+        self.combine = combine
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._batcher = MicroBatcher(self._dispatch, batch_interval, batch_max)
+    
+    async def submit(self, patient_profile: Dict) -> Dict:
+        """Queue a patient for the next batch and wait for its analysis"""
+        return await self._batcher.submit(patient_profile)
+    
+    async def close(self) -> None:
+        """Fail analyses still waiting and stop batching"""
+        await self._batcher.close()
+    
+    async def _dispatch(self, batch: List[Tuple[Dict, asyncio.Future]]) -> None:
+        """Analyze one collected batch, each distinct profile once"""
+        
+        logger.info("Dispatching Grok batch of %s patient(s)", len(batch))
+        
+        # Group identical profiles so each distinct one is analyzed once
+        groups: Dict[str, Tuple[Dict, List[asyncio.Future]]] = {}
+        for profile, future in batch:
+            key = _cache_key("grok", profile)
+            groups.setdefault(key, (profile, []))[1].append(future)
+        
+        if self.combine and len(groups) > 1:
+            await self._analyze_combined(list(groups.values()))
+            return
+        
+        await asyncio.gather(*[
+            self._analyze(profile, futures) for profile, futures in groups.values()
+        ])
+    
+    async def _analyze(self, patient_profile: Dict, futures: List[asyncio.Future]) -> None:
+        """Run one analysis and hand its result to every waiting caller"""
+        
+        async with self._semaphore:
+            try:
+                result = await GrokAnalyzer.analyze_symptoms_async(patient_profile)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        
+        for future in futures:
+            if not future.done():
+                future.set_result(dict(result))
+    
+    async def _analyze_combined(self, groups: List[Tuple[Dict, List[asyncio.Future]]]) -> None:
+        """Analyze every distinct profile of a batch with one combined Grok call"""
+        
+        async with self._semaphore:
+            try:
+                results = await GrokAnalyzer.analyze_batch_async([profile for profile, _ in groups])
+            except Exception as e:
+                for _, futures in groups:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                return
+        
+        for (_, futures), result in zip(groups, results):
+            for future in futures:
+                if not future.done():
+                    future.set_result(dict(result))
+
+
 class TriageAnalysisPipeline:
     """
     Complete pipeline:
@@ -562,47 +1665,165 @@ class TriageAnalysisPipeline:
     """
     
     @staticmethod
-    def process_patient(patient_profile: Dict, urgency_level: str) -> Dict:
+    def process_patient(
+        patient_profile: Dict,
+        urgency_level: str,
+        deadline: Optional[float] = None
+    ) -> Dict:
         """
         Full analysis pipeline with both AI models
         Falls back to local analysis if APIs unavailable
+        Both calls share one deadline (time.monotonic() based, PIPELINE_DEADLINE
+        from now by default); whichever step runs out of it uses its fallback
         """
         
-        logger.info(f"Starting analysis pipeline for patient {patient_profile.get('age')} yo")
+        logger.info("Starting analysis pipeline for patient %s yo", patient_profile.get('age'))
+        if deadline is None:
+            deadline = time.monotonic() + PIPELINE_DEADLINE
         
         # Step 1: Grok Analysis
         logger.info("Step 1: Running Grok analysis...")
-        grok_result = GrokAnalyzer.analyze_symptoms(patient_profile)
-        
-        if not grok_result.get("success"):
-            logger.error(f"Grok analysis failed: {grok_result.get('error')}")
-            grok_result["success"] = True  # Fallback succeeded
-        
-        grok_analysis = grok_result.get("analysis", "")
-        logger.info(f"Grok analysis completed (source: {grok_result.get('source', 'unknown')})")
+        grok_result = GrokAnalyzer.analyze_symptoms(patient_profile, deadline)
+        grok_analysis = _extract_key_sections(TriageAnalysisPipeline._grok_text(grok_result))
         
         # Step 2: Gemini Report
         logger.info("Step 2: Generating Gemini report...")
         gemini_result = GeminiReportGenerator.generate_final_report(
             patient_profile,
             grok_analysis,
-            urgency_level
+            urgency_level,
+            deadline
+        )
+        
+        return TriageAnalysisPipeline._combine(grok_result, gemini_result, urgency_level)
+    
+    @staticmethod
+    def process_patient_fused(patient_profile: Dict, urgency_level: str) -> Dict:
+        """
+        Single-call pipeline: Gemini produces the analysis and the report together
+        Halves the external round-trips; falls back to process_patient
+        (Grok then Gemini) when the fused call is unavailable
+        """
+        
+        logger.info("Starting fused analysis pipeline for patient %s yo", patient_profile.get('age'))
+        
+        fused = GeminiReportGenerator.generate_fused(patient_profile, urgency_level)
+        if fused is None:
+            return TriageAnalysisPipeline.process_patient(patient_profile, urgency_level)
+        
+        return TriageAnalysisPipeline._combine(fused, fused, urgency_level)
+    
+    @staticmethod
+    async def process_patient_async(
+        patient_profile: Dict,
+        urgency_level: str,
+        batcher: Optional[BatchingAnalyzer] = None,
+        deadline: Optional[float] = None
+    ) -> Dict:
+        """
+        Async pipeline for one patient
+        Gemini still waits on Grok, but the event loop is free meanwhile
+        Pass a BatchingAnalyzer to coalesce Grok calls with other patients
+        Grok and Gemini share one deadline, as in process_patient
+        """
+        
+        logger.info("Starting async analysis pipeline for patient %s yo", patient_profile.get('age'))
+        if deadline is None:
+            deadline = time.monotonic() + PIPELINE_DEADLINE
+        
+        if batcher is not None:
+            grok_result = await batcher.submit(patient_profile)
+        else:
+            grok_result = await GrokAnalyzer.analyze_symptoms_async(patient_profile, deadline)
+        grok_analysis = _extract_key_sections(TriageAnalysisPipeline._grok_text(grok_result))
+        
+        gemini_result = await GeminiReportGenerator.generate_final_report_async(
+            patient_profile,
+            grok_analysis,
+            urgency_level,
+            deadline
+        )
+        
+        return TriageAnalysisPipeline._combine(grok_result, gemini_result, urgency_level)
+    
+    @staticmethod
+    async def process_patient_fanout_async(
+        patient_profile: Dict,
+        urgency_level: str,
+        batcher: Optional[BatchingAnalyzer] = None
+    ) -> Dict:
+        """
+        Async pipeline that overlaps the Grok call with Gemini
+        Gemini writes the profile-only report sections at the same time as
+        Grok analyzes; the analysis is then merged in without a third call
+        """
+        
+        logger.info("Starting fan-out analysis pipeline for patient %s yo", patient_profile.get('age'))
+        
+        if batcher is not None:
+            grok_call = batcher.submit(patient_profile)
+        else:
+            grok_call = GrokAnalyzer.analyze_symptoms_async(patient_profile)
+        
+        grok_result, sections = await asyncio.gather(
+            grok_call,
+            GeminiReportGenerator.generate_static_sections_async(patient_profile, urgency_level)
         )
+        grok_analysis = TriageAnalysisPipeline._grok_text(grok_result)
+        
+        if sections is None:
+            gemini_result = GeminiReportGenerator._fallback_report(patient_profile, grok_analysis, urgency_level)
+        else:
+            gemini_result = GeminiReportGenerator.merge_narrative(
+                patient_profile, grok_analysis, urgency_level, sections
+            )
+        
+        return TriageAnalysisPipeline._combine(grok_result, gemini_result, urgency_level)
+    
+    @staticmethod
+    async def process_patients_async(
+        patients: List[Tuple[Dict, str]],
+        batcher: Optional[BatchingAnalyzer] = None
+    ) -> List[Dict]:
+        """
+        Run the pipeline for many (patient_profile, urgency_level) pairs concurrently
+        N patients issue N Grok calls at once, then their Gemini calls
+        """
+        
+        return await asyncio.gather(*[
+            TriageAnalysisPipeline.process_patient_async(profile, urgency, batcher)
+            for profile, urgency in patients
+        ])
+    
+    @staticmethod
+    def _grok_text(grok_result: Dict) -> str:
+        """Log the Grok step outcome and return its analysis text"""
+        
+        if not grok_result.get("success"):
+            logger.error("Grok analysis failed: %s", grok_result.get('error'))
+            grok_result["success"] = True  # Fallback succeeded
+        
+        logger.info("Grok analysis completed (source: %s)", grok_result.get('source', 'unknown'))
+        return grok_result.get("analysis", "")
+    
+    @staticmethod
+    def _combine(grok_result: Dict, gemini_result: Dict, urgency_level: str) -> Dict:
+        """Merge both model results into the pipeline output"""
         
         if not gemini_result.get("success"):
-            logger.error(f"Gemini report failed: {gemini_result.get('error')}")
+            logger.error("Gemini report failed: %s", gemini_result.get('error'))
             gemini_result["success"] = True  # Fallback succeeded
         
         final_report = gemini_result.get("report", "")
-        logger.info(f"Gemini report completed (source: {gemini_result.get('source', 'unknown')})")
+        logger.info("Gemini report completed (source: %s)", gemini_result.get('source', 'unknown'))
         
         logger.info("Analysis pipeline completed successfully")
         
         return {
             "success": True,
-            "grok_analysis": grok_analysis,
+            "grok_analysis": grok_result.get("analysis", ""),
             "final_report": final_report,
             "urgency_level": urgency_level,
             "models_used": [grok_result.get('model', 'unknown'), gemini_result.get('model', 'unknown')],
             "sources": [grok_result.get('source', 'unknown'), gemini_result.get('source', 'unknown')]
-        }
\ No newline at end of file
+        }
@@ -3,90 +3,54 @@ LLM Integration: OpenRouter (Llama 3.3 - Stable)
 """
 
 import os
-import requests
+import time
+import asyncio
+import hashlib
+import httpx
 import logging
-from typing import Dict
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from llm_common import (
+    HTTP2_AVAILABLE, MAX_RETRIES, RETRY_STATUS_CODES, RETRYABLE_ERRORS,
+    clip_field, json_dumps, json_loads, retry_delay
+)
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 # API Key
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-
-
-def call_llm(prompt: str, model: str = "meta-llama/llama-3.3-70b-instruct") -> str:
-    """
-    Calls OpenRouter LLM API and returns response text
-    """
-
-    if not OPENROUTER_API_KEY:
-        raise Exception("OPENROUTER_API_KEY not set in environment variables")
-
-    url = "https://openrouter.ai/api/v1/chat/completions"
-
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": "You are a medical triage assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.6
-    }
-
-    try:
-        response = requests.post(
-            url,
-            headers=headers,
-            json=data,
-            timeout=30
-        )
-
-        if response.status_code != 200:
-            raise Exception(f"API Error: {response.text}")
-
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
-
-    except Exception as e:
-        logger.error(f"OpenRouter API error: {e}")
-        raise Exception(str(e))
-
-
-class TriageAnalysisPipeline:
-
-    @staticmethod
-    def process_patient(
-        patient_profile: Dict,
-        urgency_level: str,
-        ml_predictions=None
-    ) -> Dict:
-
-        logger.info("Running OpenRouter pipeline...")
-
-        # -------------------------
-        # 🧠 FINAL PROMPT
-        # -------------------------
-        prompt = f"""
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "meta-llama/llama-3.3-70b-instruct"
+
+# Built once at import; every request reuses the same dict
+_HEADERS = {
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# Constant system message, shared (never mutated) by every request
+_SYSTEM_MSG = {"role": "system", "content": "You are a medical triage assistant."}
+
+# -------------------------
+# 🧠 FINAL PROMPT (filled per patient with str.format_map)
+# -------------------------
+_TRIAGE_PROMPT_TMPL = """
 You are a medical triage assistant. Analyze this patient carefully.
 
 PATIENT DETAILS:
-Age: {patient_profile.get('age')}
-Gender: {patient_profile.get('gender')}
-Primary Symptom: {patient_profile.get('primary_symptom')}
-Duration: {patient_profile.get('duration')}
-Severity: {patient_profile.get('severity_score')}
+Age: {age}
+Gender: {gender}
+Primary Symptom: {primary_symptom}
+Duration: {duration}
+Severity: {severity_score}
 
 Additional Symptoms:
-{patient_profile.get('additional_symptoms')}
+{additional_symptoms}
 
 Medical History:
-{patient_profile.get('medical_history')}
+{medical_history}
 
 ML PREDICTIONS:
 {ml_predictions}
@@ -121,26 +85,298 @@ IMPORTANT:
 - Keep it clear and structured
 """
 
+REQUEST_TIMEOUT = 30.0  # seconds for a single OpenRouter call
+PIPELINE_DEADLINE = 25.0  # seconds one advanced analysis may take end to end
+
+# Shared async client so concurrent sessions reuse pooled connections
+# instead of blocking the event loop on a synchronous request each
+_client = httpx.AsyncClient(
+    timeout=REQUEST_TIMEOUT,
+    http2=HTTP2_AVAILABLE,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+)
+
+
+# Content-addressed cache of model responses: identical prompts (same profile,
+# urgency and ML predictions) skip the API round trip for a day
+LLM_CACHE_SIZE = 1024
+LLM_CACHE_TTL = 86400  # seconds
+_response_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+
+def _cache_key(prompt: str, model: str) -> str:
+    return hashlib.sha256(json_dumps([model, prompt])).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    expires, text = entry
+    if expires < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return text
+
+
+def _cache_put(key: str, text: str) -> None:
+    _response_cache[key] = (time.monotonic() + LLM_CACHE_TTL, text)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > LLM_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+
+def _next_delay(attempt: int, retry_after: Optional[str], deadline: Optional[float]) -> float:
+    """Backoff before the next attempt; raises TimeoutError if waiting would pass the deadline"""
+    delay = retry_delay(attempt, retry_after)
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        raise TimeoutError("Analysis deadline exceeded")
+    return delay
+
+
+def _remaining(deadline: Optional[float]) -> float:
+    """Timeout for the next attempt; raises TimeoutError once the deadline has passed"""
+    if deadline is None:
+        return REQUEST_TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Analysis deadline exceeded")
+    return max(1.0, min(REQUEST_TIMEOUT, remaining))
+
+
+async def close_client() -> None:
+    """Close the shared OpenRouter client (FastAPI shutdown event)"""
+    await _client.aclose()
+
+
+def _build_request(prompt: str, model: str, stream: bool = False) -> Tuple[Dict, Dict]:
+    """Headers and chat-completion payload shared by call_llm and stream_llm"""
+
+    headers = _HEADERS
+
+    data = {
+        "model": model,
+        "messages": [_SYSTEM_MSG, {"role": "user", "content": prompt}],
+        "temperature": 0.6
+    }
+    if stream:
+        data["stream"] = True
+
+    return headers, data
+
+
+async def call_llm(prompt: str, model: str = DEFAULT_MODEL, deadline: Optional[float] = None) -> str:
+    """
+    Calls OpenRouter LLM API and returns response text
+    With a deadline (time.monotonic() based) retries stop at it and
+    TimeoutError is raised instead of waiting past it
+    """
+
+    if not OPENROUTER_API_KEY:
+        raise Exception("OPENROUTER_API_KEY not set in environment variables")
+
+    cache_key = _cache_key(prompt, model)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("LLM response served from cache")
+        return cached
+
+    headers, data = _build_request(prompt, model)
+
+    try:
+        body = json_dumps(data)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = await _client.post(
+                    OPENROUTER_URL,
+                    headers=headers,
+                    content=body,
+                    timeout=_remaining(deadline)
+                )
+            except RETRYABLE_ERRORS:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _next_delay(attempt, None, deadline)
+                logger.warning("OpenRouter connection failed - retrying")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                break
+            delay = _next_delay(attempt, response.headers.get("Retry-After"), deadline)
+            logger.warning("OpenRouter returned %s - retrying", response.status_code)
+            await asyncio.sleep(delay)
+
+        if response.status_code != 200:
+            raise Exception(f"API Error: {response.text}")
+
+        result = json_loads(response.content)
+        text = result["choices"][0]["message"]["content"]
+        if text:
+            _cache_put(cache_key, text)
+        return text
+
+    except (TimeoutError, httpx.TimeoutException) as e:
+        logger.error("OpenRouter API timeout: %s", e)
+        raise TimeoutError(str(e) or "OpenRouter request timed out")
+
+    except Exception as e:
+        logger.error("OpenRouter API error: %s", e)
+        raise Exception(str(e))
+
+
+async def stream_llm(prompt: str, model: str = DEFAULT_MODEL) -> AsyncIterator[str]:
+    """
+    Streams OpenRouter response text as it is generated
+    Yields content deltas; the full text is cached once the stream completes
+    """
+
+    if not OPENROUTER_API_KEY:
+        raise Exception("OPENROUTER_API_KEY not set in environment variables")
+
+    cache_key = _cache_key(prompt, model)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("LLM response served from cache")
+        yield cached
+        return
+
+    headers, data = _build_request(prompt, model, stream=True)
+    body = json_dumps(data)
+    chunks = []
+
+    # Transient failures are retried only before any token has been yielded
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await _client.send(
+                _client.build_request("POST", OPENROUTER_URL, headers=headers, content=body),
+                stream=True
+            )
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_RETRIES:
+                raise
+            logger.warning("OpenRouter connection failed - retrying")
+            await asyncio.sleep(retry_delay(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+            break
+        await response.aclose()
+        logger.warning("OpenRouter returned %s - retrying", response.status_code)
+        await asyncio.sleep(retry_delay(attempt, response.headers.get("Retry-After")))
+
+    try:
+        if response.status_code != 200:
+            await response.aread()
+            raise Exception(f"API Error: {response.text}")
+
+        async for line in response.aiter_lines():
+            # SSE frames are "data: {...}"; OpenRouter also sends ": keep-alive" comments
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            choices = json_loads(payload).get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                chunks.append(delta)
+                yield delta
+    finally:
+        await response.aclose()
+
+    # An empty stream is not cached, or it would be served as a blank report
+    text = "".join(chunks)
+    if text:
+        _cache_put(cache_key, text)
+
+
+class TriageAnalysisPipeline:
+
+    @staticmethod
+    async def process_patient(
+        patient_profile: Dict,
+        urgency_level: str,
+        ml_predictions=None,
+        deadline: Optional[float] = None
+    ) -> Dict:
+        """
+        Runs the triage analysis within a deadline (PIPELINE_DEADLINE from now by
+        default); TimeoutError propagates so the API can answer 504
+        """
+
+        logger.info("Running OpenRouter pipeline...")
+
+        if deadline is None:
+            deadline = time.monotonic() + PIPELINE_DEADLINE
+
+        prompt = TriageAnalysisPipeline._build_prompt(patient_profile, urgency_level, ml_predictions)
+
         # -------------------------
         # 🔥 CALL LLM
         # -------------------------
         try:
-            response_text = call_llm(prompt)
+            response_text = await call_llm(prompt, deadline=deadline)
 
             logger.info("LLM analysis successful")
 
-            return {
-                "success": True,
-                "analysis": response_text,
-                "final_report": response_text,
-                "urgency_level": urgency_level,
-                "models_used": ["meta-llama/llama-3.3-70b-instruct"]
-            }
+            return TriageAnalysisPipeline.build_result(response_text, urgency_level)
+
+        except TimeoutError:
+            logger.error("Analysis exceeded its deadline")
+            raise
 
         except Exception as e:
-            logger.error(f"Analysis failed: {e}")
+            logger.error("Analysis failed: %s", e)
 
             return {
                 "success": False,
                 "error": str(e)
-            }
\ No newline at end of file
+            }
+
+    @staticmethod
+    async def stream_patient(
+        patient_profile: Dict,
+        urgency_level: str,
+        ml_predictions=None
+    ) -> AsyncIterator[str]:
+        """Same analysis as process_patient, yielded as text deltas while generated"""
+
+        logger.info("Running OpenRouter streaming pipeline...")
+
+        prompt = TriageAnalysisPipeline._build_prompt(patient_profile, urgency_level, ml_predictions)
+
+        async for delta in stream_llm(prompt):
+            yield delta
+
+    @staticmethod
+    def build_result(response_text: str, urgency_level: str) -> Dict:
+        """Pipeline output for a completed analysis"""
+
+        return {
+            "success": True,
+            "analysis": response_text,
+            "final_report": response_text,
+            "urgency_level": urgency_level,
+            "models_used": [DEFAULT_MODEL]
+        }
+
+    @staticmethod
+    def _build_prompt(patient_profile: Dict, urgency_level: str, ml_predictions=None) -> str:
+        """Fill the precompiled triage prompt with this patient's fields"""
+
+        def get(name):
+            return clip_field(name, patient_profile.get(name))
+
+        return _TRIAGE_PROMPT_TMPL.format_map({
+            "age": get('age'),
+            "gender": get('gender'),
+            "primary_symptom": get('primary_symptom'),
+            "duration": get('duration'),
+            "severity_score": get('severity_score'),
+            "additional_symptoms": get('additional_symptoms'),
+            "medical_history": get('medical_history'),
+            "ml_predictions": ml_predictions,
+            "urgency_level": urgency_level,
+        })
@@ -2,10 +2,13 @@
 Advanced analysis using OpenRouter LLM
 """
 
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from typing import List, Optional, Dict
 from datetime import datetime
 import json
@@ -13,10 +16,11 @@ import uuid
 
 from ml_service import MLService  # ✅ ADDED
 from triage_engine import TriageEngine, PatientProfile
-from rag_system import RAGSystem
+from rag_system import RAGSystem, BatchingRetriever
 from risk_scorer import RiskScorer
-from llm_integration import TriageAnalysisPipeline
+from llm_integration import TriageAnalysisPipeline, close_client
 from triage_based_model import TriageBasedAssessment
+from session_store import create_session_store
 from dotenv import load_dotenv
 import os
 
@@ -33,7 +37,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="HealthMate Advanced - OpenRouter LLM",
     description="AI-powered emergency triage with Grok analysis & Gemini reports",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS
@@ -45,16 +50,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
-triage_engine = TriageEngine()
+# Initialize components (each session gets its own TriageEngine)
 rag_system = RAGSystem()
+rag_retriever = BatchingRetriever(rag_system)  # coalesces concurrent RAG lookups
 risk_scorer = RiskScorer()
 
 # ✅ LOAD ML MODEL GLOBALLY
 ml_service = MLService()
 
-# Session store
-sessions: Dict[str, Dict] = {}
+# Session store (Redis when REDIS_URL is set, so workers share sessions)
+session_store = create_session_store()
 
 
 # ============================================================================
@@ -91,6 +96,46 @@ class DiagnosticQuestionResponse(BaseModel):
     symptom: str
 
 
+# ============================================================================
+# Lifecycle
+# ============================================================================
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled LLM and session-store connections"""
+    await close_client()
+    await rag_retriever.close()
+    rag_system.close()
+    await session_store.close()
+
+
+# ============================================================================
+# Error Handlers
+# ============================================================================
+
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: Request, exc: StarletteHTTPException):
+    """
+    HTTP errors as JSON, keeping the original status code and headers
+    Registered on Starlette's base class so routing 404/405s are covered too
+    """
+    return ORJSONResponse(
+        {"error": exc.detail, "status_code": exc.status_code},
+        status_code=exc.status_code,
+        headers=exc.headers
+    )
+
+
+@app.exception_handler(Exception)
+async def general_exception_handler(request: Request, exc: Exception):
+    """Unhandled errors as a JSON 500 without leaking internals"""
+    logger.exception(f"Unhandled error on {request.url.path}: {exc}")
+    return ORJSONResponse(
+        {"error": "Internal server error", "status_code": 500},
+        status_code=500
+    )
+
+
 # ============================================================================
 # Routes
 # ============================================================================
@@ -111,9 +156,10 @@ async def start_session():
     """Start new session"""
     session_id = str(uuid.uuid4())
     
-    triage_engine.reset()
+    engine = TriageEngine()
     
-    sessions[session_id] = {
+    await session_store.set(session_id, {
+        "engine": engine,
         "created_at": datetime.now().isoformat(),
         "messages": [],
         "completed": False,
@@ -121,9 +167,9 @@ async def start_session():
         "diagnostic_answers": [],
         "current_symptom": None,
         "ml_predictions": []  # ✅ ADDED
-    }
+    })
     
-    greeting = triage_engine.get_initial_greeting()
+    greeting = engine.get_initial_greeting()
     
     logger.info(f"Session started: {session_id}")
     
@@ -140,37 +186,42 @@ async def process_conversation(request: ConversationRequest):
     session_id = request.session_id
     user_message = request.user_message
     
-    if session_id not in sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Process through triage engine
-    response = triage_engine.process_user_input(user_message)
+    engine = session["engine"]
+    # Triage, risk and ML steps are synchronous - run them off the event loop
+    response = await asyncio.to_thread(engine.process_user_input, user_message)
     
     is_emergency = response.get("emergency_detected", False)
     
-    sessions[session_id]["messages"].append(("user", user_message))
-    sessions[session_id]["messages"].append(("assistant", response["message"]))
+    session["messages"].append(("user", user_message))
+    session["messages"].append(("assistant", response["message"]))
     
     # If triage complete
     should_continue = response.get("should_continue", True)
     if not should_continue and not is_emergency:
-        patient_profile = triage_engine.get_patient_profile()
-        risk_score_obj = risk_scorer.calculate_risk(patient_profile)
+        patient_profile = engine.get_patient_profile()
+        risk_score_obj = await asyncio.to_thread(risk_scorer.calculate_risk, patient_profile)
         
-        sessions[session_id]["completed"] = True
-        sessions[session_id]["risk_assessment"] = risk_score_obj
-        sessions[session_id]["current_symptom"] = patient_profile.primary_symptom
+        session["completed"] = True
+        session["risk_assessment"] = risk_score_obj
+        session["current_symptom"] = patient_profile.primary_symptom
 
         # =========================================
         # 🧠 ML PREDICTION STEP (ADDED)
         # =========================================
         user_summary = json.dumps(patient_profile.to_dict(), ensure_ascii=False)
-        predictions = ml_service.predict(user_summary)
-        sessions[session_id]["ml_predictions"] = predictions
+        predictions = await asyncio.to_thread(ml_service.predict, user_summary)
+        session["ml_predictions"] = predictions
 
         logger.info(f"ML Predictions: {predictions}")
         logger.info(f"Triage complete: {session_id}")
     
+    await session_store.set(session_id, session)
+    
     return ConversationResponse(
         session_id=session_id,
         assistant_message=response["message"],
@@ -185,30 +236,35 @@ async def advanced_analysis(session_id: str):
     NEW: Use Grok AI + Gemini for advanced analysis
     """
     
-    if session_id not in sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    if not sessions[session_id].get("completed"):
+    if not session.get("completed"):
         raise HTTPException(status_code=400, detail="Triage not yet complete")
     
-    patient_profile = triage_engine.get_patient_profile()
-    risk_score_obj = sessions[session_id]["risk_assessment"]
-    ml_predictions = sessions[session_id].get("ml_predictions", [])  # ✅ ADDED
+    patient_profile = session["engine"].get_patient_profile()
+    risk_score_obj = session["risk_assessment"]
+    ml_predictions = session.get("ml_predictions", [])  # ✅ ADDED
     
     logger.info(f"Starting advanced analysis: {session_id}")
     
     # Run Grok + Gemini pipeline
-    result = TriageAnalysisPipeline.process_patient(
-        patient_profile=patient_profile.to_dict(),
-        urgency_level=risk_score_obj.urgency_level.value[0],
-        ml_predictions=ml_predictions  # ✅ ADDED
-    )
+    try:
+        result = await TriageAnalysisPipeline.process_patient(
+            patient_profile=patient_profile.to_dict(),
+            urgency_level=risk_score_obj.urgency_level.value[0],
+            ml_predictions=ml_predictions  # ✅ ADDED
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out - please retry")
     
     if not result["success"]:
         logger.error(f"Analysis failed: {result['error']}")
         raise HTTPException(status_code=500, detail=result["error"])
     
-    sessions[session_id]["analysis_result"] = result
+    session["analysis_result"] = result
+    await session_store.set(session_id, session)
     
     return AdvancedAnalysisResponse(
         session_id=session_id,
@@ -219,26 +275,78 @@ async def advanced_analysis(session_id: str):
     )
 
 
+@app.get("/api/advanced-analysis-stream/{session_id}")
+async def advanced_analysis_stream(session_id: str):
+    """
+    Same analysis as /api/advanced-analysis, streamed as server-sent events
+    Each event carries {"delta": "..."}; the stream ends with "data: [DONE]"
+    """
+    
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if not session.get("completed"):
+        raise HTTPException(status_code=400, detail="Triage not yet complete")
+    
+    patient_profile = session["engine"].get_patient_profile()
+    urgency_level = session["risk_assessment"].urgency_level.value[0]
+    ml_predictions = session.get("ml_predictions", [])
+    
+    logger.info(f"Starting streamed advanced analysis: {session_id}")
+    
+    async def event_stream():
+        chunks = []
+        try:
+            async for delta in TriageAnalysisPipeline.stream_patient(
+                patient_profile=patient_profile.to_dict(),
+                urgency_level=urgency_level,
+                ml_predictions=ml_predictions
+            ):
+                chunks.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+        except Exception as e:
+            logger.error(f"Streamed analysis failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            return
+        
+        # Re-read so changes made while streaming (possibly on another worker) survive
+        latest = await session_store.get(session_id)
+        if latest is not None:
+            latest["analysis_result"] = TriageAnalysisPipeline.build_result(
+                "".join(chunks), urgency_level
+            )
+            await session_store.set(session_id, latest)
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/triage-result/{session_id}")
 async def get_triage_result(session_id: str):
     """Get triage assessment"""
     
-    if session_id not in sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    if not sessions[session_id].get("completed"):
+    if not session.get("completed"):
         raise HTTPException(status_code=400, detail="Triage not complete")
     
-    patient_profile = triage_engine.get_patient_profile()
-    risk_score_obj = sessions[session_id]["risk_assessment"]
-    ml_predictions = sessions[session_id].get("ml_predictions", [])  # ✅ ADDED
+    patient_profile = session["engine"].get_patient_profile()
+    risk_score_obj = session["risk_assessment"]
+    ml_predictions = session.get("ml_predictions", [])  # ✅ ADDED
     
     # =========================================
     # 🧠 RAG QUERY (FINAL)
     # =========================================
     rag_query = f"{patient_profile.primary_symptom} {ml_predictions}"
 
-    rag_response = rag_system.generate_grounded_response(rag_query)
+    rag_response = await rag_retriever.submit(rag_query)
     
     
     return {
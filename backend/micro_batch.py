@@ -0,0 +1,118 @@
+"""
+Micro-batching for the async API
+Requests arriving close together are collected into one batch and handed to
+a dispatch callback; used for RAG lookups and Grok analyses
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# One queued request: the submitted item and the future its caller awaits
+BatchEntry = Tuple[Any, asyncio.Future]
+
+
+class BatcherClosedError(RuntimeError):
+    """Raised to callers whose request was still waiting when the batcher closed"""
+
+
+def fail_waiting(batch: List[BatchEntry], error: BaseException) -> None:
+    """Set error on every future in the batch that has no result yet"""
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+class MicroBatcher:
+    """
+    Collects items submitted within batch_interval (up to batch_max) and calls
+    dispatch(batch) with the list of (item, future) pairs
+    dispatch sets the results; any future it leaves unresolved (because it
+    raised or was cancelled) is failed here, so no caller waits forever
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[List[BatchEntry]], Awaitable[None]],
+        batch_interval: float,
+        batch_max: int
+    ):
+        self.dispatch = dispatch
+        self.batch_interval = batch_interval
+        self.batch_max = batch_max
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._collecting: List[BatchEntry] = []  # batch the worker is still filling
+        self._pending: Set[asyncio.Task] = set()  # dispatched batches not finished yet
+
+    async def submit(self, item) -> Any:
+        """Queue an item for the next batch and wait for its result"""
+
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def close(self) -> None:
+        """
+        Stop collecting, fail every request that was not dispatched yet, then
+        cancel the dispatched batches and wait for them to finish
+        """
+
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        waiting, self._collecting = self._collecting, []
+        while self._queue is not None and not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        fail_waiting(waiting, BatcherClosedError("Batcher closed before the request was dispatched"))
+
+        tasks = list(self._pending)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self) -> None:
+        """Drain the queue in batches for as long as the batcher is in use"""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            self._collecting = [await self._queue.get()]
+            deadline = loop.time() + self.batch_interval
+
+            while len(self._collecting) < self.batch_max:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._collecting.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self._collecting = self._collecting, []
+            # Held in _pending so the task can't be garbage collected mid-flight
+            task = asyncio.create_task(self._dispatch(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _dispatch(self, batch: List[BatchEntry]) -> None:
+        try:
+            await self.dispatch(batch)
+        except asyncio.CancelledError:
+            fail_waiting(batch, BatcherClosedError("Batcher closed before the request was answered"))
+            raise
+        except Exception as e:
+            logger.error("Batch dispatch failed: %s", e)
+            fail_waiting(batch, e)
+        else:
+            fail_waiting(batch, RuntimeError("Batch finished without a result for this request"))
@@ -5,21 +5,206 @@ Uses sentence-transformers embeddings and FAISS for efficient retrieval
 Prevents hallucination by grounding responses in curated medical documents
 """
 
+import asyncio
 import logging
+import hashlib
+import heapq
 import json
+import math
+import pickle
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
 import numpy as np
+from importlib.util import find_spec
 from typing import List, Dict, Tuple, Optional
 from pathlib import Path
+from micro_batch import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+# faiss and sentence-transformers (with torch) are only looked up here; they
+# are imported on first use so API paths that never hit RAG don't pay for them
+FAISS_AVAILABLE = bool(find_spec("faiss") and find_spec("sentence_transformers"))
+if not FAISS_AVAILABLE:
+    logger.warning("FAISS not available - using basic retrieval fallback")
+
+faiss = None
+SentenceTransformer = None
+torch = None
+
 try:
-    from sentence_transformers import SentenceTransformer
-    import faiss
-    FAISS_AVAILABLE = True
+    from rank_bm25 import BM25Okapi
+    BM25_AVAILABLE = True
 except ImportError:
-    FAISS_AVAILABLE = False
-    logger.warning("FAISS not available - using basic retrieval fallback")
+    BM25_AVAILABLE = False
+    logger.warning("rank-bm25 not available - keyword fallback uses Jaccard similarity")
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> List[str]:
+    # interned so vocabulary/BM25 dict lookups compare by identity first
+    return [sys.intern(token) for token in _TOKEN_RE.findall(text.lower())]
+
+
+if NUMBA_AVAILABLE:
+    _M1 = np.uint64(0x5555555555555555)
+    _M2 = np.uint64(0x3333333333333333)
+    _M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+    _H01 = np.uint64(0x0101010101010101)
+    _S1, _S2, _S4, _S56 = np.uint64(1), np.uint64(2), np.uint64(4), np.uint64(56)
+
+    @njit(parallel=True, cache=True)
+    def _shared_term_counts(query_bits, doc_bits):
+        """popcount(query & doc) per document row, SWAR popcount per 64-term word"""
+        counts = np.zeros(doc_bits.shape[0], dtype=np.int64)
+        for i in prange(doc_bits.shape[0]):
+            total = 0
+            for j in range(doc_bits.shape[1]):
+                x = query_bits[j] & doc_bits[i, j]
+                x = x - ((x >> _S1) & _M1)
+                x = (x & _M2) + ((x >> _S2) & _M2)
+                x = (x + (x >> _S4)) & _M4
+                total += (x * _H01) >> _S56
+            counts[i] = total
+        return counts
+else:
+    def _shared_term_counts(query_bits, doc_bits):
+        """popcount(query & doc) per document row"""
+        shared = doc_bits & query_bits
+        if hasattr(np, "bitwise_count"):
+            return np.bitwise_count(shared).sum(axis=1, dtype=np.int64)
+        return np.unpackbits(shared.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+def _aligned_float32(matrix: np.ndarray, alignment: int = 64) -> np.ndarray:
+    """
+    C-contiguous float32 copy of matrix starting on an alignment-byte boundary
+    Lets the FAISS SIMD kernels use aligned loads without split cache lines
+    """
+    itemsize = np.dtype(np.float32).itemsize
+    buf = np.empty(matrix.size + alignment // itemsize, dtype=np.float32)
+    offset = (-buf.ctypes.data % alignment) // itemsize
+    aligned = buf[offset:offset + matrix.size].reshape(matrix.shape)
+    aligned[...] = matrix
+    return aligned
+
+
+def _import_faiss():
+    """Import faiss on first use"""
+    global faiss
+    if faiss is None:
+        import faiss as _faiss
+        # faiss-cpu wheels pick the widest SIMD build the CPU supports at import;
+        # a generic build here means distance kernels run without AVX2
+        simd = [opt for opt in _faiss.get_compile_options().split() if opt.startswith("AVX")]
+        if simd:
+            logger.info(f"FAISS SIMD kernels: {' '.join(simd)}")
+        else:
+            logger.warning("FAISS loaded without AVX2/AVX-512 kernels - install faiss-cpu>=1.8")
+        faiss = _faiss
+    return faiss
+
+
+def _import_encoder():
+    """Import sentence-transformers (and torch) on first use"""
+    global SentenceTransformer, torch
+    if SentenceTransformer is None:
+        import torch as _torch  # installed with sentence-transformers
+        from sentence_transformers import SentenceTransformer as _SentenceTransformer
+        torch = _torch
+        SentenceTransformer = _SentenceTransformer
+    return SentenceTransformer
+
+
+class SemanticQueryCache:
+    """
+    Retrieval results for recent query embeddings
+    A query whose cosine similarity to a cached one reaches threshold reuses
+    that result and skips the index search. When full, the entry with the
+    lowest alpha * frequency + (1 - alpha) * exp(-age / beta) is evicted
+    """
+    
+    def __init__(self, threshold: float = 0.9, max_entries: int = 500,
+                 alpha: float = 0.6, beta: float = 3600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.alpha = alpha
+        self.beta = beta
+        self._embeddings: Optional[np.ndarray] = None  # [max_entries, dim], normalized rows
+        self._hits = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)  # wall clock, survives restarts
+        self._results: List[Tuple[int, List[Dict]]] = []  # (top_k, results) per row
+        self._lock = threading.Lock()
+    
+    def get(self, embedding: np.ndarray, top_k: int) -> Optional[List[Dict]]:
+        with self._lock:
+            count = len(self._results)
+            if not count:
+                return None
+            sims = self._embeddings[:count] @ embedding
+            row = int(np.argmax(sims))
+            cached_k, results = self._results[row]
+            if sims[row] < self.threshold or cached_k < top_k:
+                return None
+            self._hits[row] += 1
+            self._last_used[row] = time.time()
+            return results[:top_k]
+    
+    def put(self, embedding: np.ndarray, top_k: int, results: List[Dict]) -> None:
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_entries, embedding.shape[0]), dtype='float32')
+            count = len(self._results)
+            if count < self.max_entries:
+                row = count
+                self._results.append((top_k, results))
+            else:
+                row = self._eviction_row()
+                self._results[row] = (top_k, results)
+            self._embeddings[row] = embedding
+            self._hits[row] = 1
+            self._last_used[row] = time.time()
+    
+    def _eviction_row(self) -> int:
+        frequency = self._hits / self._hits.max()
+        recency = np.exp(-(time.time() - self._last_used) / self.beta)
+        return int(np.argmin(self.alpha * frequency + (1 - self.alpha) * recency))
+    
+    def save(self, path: Path) -> None:
+        with self._lock:
+            if not self._results:
+                return
+            count = len(self._results)
+            state = {
+                "embeddings": self._embeddings[:count],
+                "hits": self._hits[:count],
+                "last_used": self._last_used[:count],
+                "results": self._results,
+            }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def load(self, path: Path) -> None:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        count = min(len(state["results"]), self.max_entries)
+        with self._lock:
+            self._embeddings = np.zeros((self.max_entries, state["embeddings"].shape[1]), dtype='float32')
+            self._embeddings[:count] = state["embeddings"][:count]
+            self._hits[:count] = state["hits"][:count]
+            self._last_used[:count] = state["last_used"][:count]
+            self._results = list(state["results"][:count])
 
 
 class MedicalKnowledgeBase:
@@ -28,6 +213,28 @@ class MedicalKnowledgeBase:
     Stored as embeddings indexed by FAISS
     """
     
+    MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
+    # Encoded embeddings and the built index are kept here between restarts
+    CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+    
+    # 8-bit scalar-quantized cosine scan up to this many documents, IVF-PQ above it
+    INDEX_LAYOUT = "sq8|ivfpq"  # part of the cache key; change when _build_index changes
+    FLAT_INDEX_MAX_DOCS = 1000
+    IVF_NPROBE = 8  # Voronoi cells scanned per query
+    PQ_SUBQUANTIZERS = 16  # must divide the embedding dimension
+    # One search thread: on a corpus this size OpenMP start-up costs more than the scan
+    SEARCH_THREADS = 1
+    # INT8 dynamic quantization of the encoder's Linear layers (CPU only);
+    # ~2-4x faster encode, same model for documents and queries
+    QUANTIZE_ENCODER = True
+    # Exact-match LRU of query embeddings, checked before encoding
+    QUERY_EMBEDDING_CACHE_SIZE = 1024
+    # Documents are encoded as bullet-aligned chunks of about this many words,
+    # each repeating the tail of the previous one; both are part of the cache key
+    CHUNK_TOKENS = 64
+    CHUNK_OVERLAP_TOKENS = 20
+    ENCODE_BATCH_SIZE = 32
+    
     KNOWLEDGE_DOCUMENTS = [
         {
             "id": "chest_pain_001",
@@ -334,77 +541,328 @@ class MedicalKnowledgeBase:
         self.index = None
         self.model = None
         self.document_texts = None
+        self._chunk_parent = None  # chunk row -> index into self.documents
+        self._model_lock = threading.Lock()
+        self._by_id = {doc["id"]: doc for doc in self.documents}
+        self._by_category: Dict[str, List[Dict]] = defaultdict(list)
+        for doc in self.documents:
+            self._by_category[doc["category"]].append(doc)
+        # Formatted guidance block per document, joined as-is by RAGSystem
+        # (kept here rather than on the shared document dicts)
+        self.guidance_blocks = {doc["id"]: f"\n### {doc['title']}{doc['content']}" for doc in self.documents}
+        self.query_cache = SemanticQueryCache()
+        self._query_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        self._initialize_keyword_index()
         self._initialize_embeddings()
     
+    def _initialize_keyword_index(self):
+        """Tokenize the corpus once for the keyword fallback (BM25 when available)"""
+        self._doc_tokens = [_tokenize(doc["title"] + " " + doc["content"]) for doc in self.documents]
+        self._bm25 = BM25Okapi(self._doc_tokens) if BM25_AVAILABLE else None
+        
+        # Jaccard fallback: term-presence bitsets, one uint64 per 64 vocabulary terms
+        wordsets = [set(tokens) for tokens in self._doc_tokens]
+        self._vocab = {word: i for i, word in enumerate(sorted(set().union(*wordsets)))}
+        self._doc_bits = np.zeros((len(wordsets), len(self._vocab) // 64 + 1), dtype=np.uint64)
+        for row, words in zip(self._doc_bits, wordsets):
+            self._set_bits(row, words)
+        self._doc_word_counts = np.array([len(words) for words in wordsets], dtype=np.int64)
+    
+    def _set_bits(self, row: np.ndarray, words) -> None:
+        for word in words:
+            i = self._vocab.get(word)
+            if i is not None:
+                row[i // 64] |= np.uint64(1) << np.uint64(i % 64)
+    
     def _initialize_embeddings(self):
-        """Initialize embedding model and FAISS index"""
+        """
+        Initialize FAISS index, from the on-disk cache when the corpus is unchanged
+        On a cache hit sentence-transformers isn't even imported until the first query
+        """
         try:
             if FAISS_AVAILABLE:
-                self.model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
-                self.document_texts = [doc["content"] for doc in self.documents]
-                self.embeddings = self.model.encode(self.document_texts, convert_to_numpy=True)
-                self.embeddings = np.asarray(self.embeddings).astype('float32')
-                
-                # Create FAISS index
-                self.index = faiss.IndexFlatL2(self.embeddings.shape[1])
-                self.index.add(self.embeddings)
-                logger.info(f"RAG Knowledge Base initialized with {len(self.documents)} documents")
+                _import_faiss()
+                self.document_texts, self._chunk_parent = self._chunk_documents()
+                if self._load_cached_index():
+                    logger.info(f"RAG Knowledge Base loaded from cache with {len(self.documents)} documents")
+                else:
+                    self._load_model()
+                    # Normalized by the encoder so inner product is cosine similarity;
+                    # encode already returns float32, so the cast doesn't copy
+                    embeddings = self.model.encode(
+                        self.document_texts, batch_size=self.ENCODE_BATCH_SIZE,
+                        convert_to_numpy=True, normalize_embeddings=True
+                    ).astype('float32', copy=False)
+                    # The index holds its own 8-bit codes; the FP32 matrix isn't kept
+                    self.index = self._build_index(_aligned_float32(embeddings))
+                    # Swap the freshly built index for the mapped copy so this
+                    # worker shares pages with the ones that start from cache
+                    if self._save_cached_index():
+                        self._load_cached_index()
+                    logger.info(f"RAG Knowledge Base initialized with {len(self.documents)} documents "
+                                f"({len(self.document_texts)} chunks)")
+                faiss.omp_set_num_threads(self.SEARCH_THREADS)
+                self._load_query_cache()
             else:
                 logger.warning("FAISS not available - using basic keyword matching")
         except Exception as e:
             logger.error(f"Error initializing embeddings: {e}")
-            self.embeddings = None
+            self.index = None
+    
+    def _load_model(self):
+        """Load the sentence encoder once; queries from several threads may race here"""
+        with self._model_lock:
+            if self.model is None:
+                model = _import_encoder()(self.MODEL_NAME)
+                if self.QUANTIZE_ENCODER:
+                    self._quantize_model(model)
+                self.model = model  # published only once ready
+    
+    def _chunk_documents(self) -> Tuple[List[str], np.ndarray]:
+        """
+        Split each document's content on bullet lines into chunks of about
+        CHUNK_TOKENS words, carrying the last CHUNK_OVERLAP_TOKENS words of
+        bullets into the next chunk; the heading line starts every chunk
+        """
+        chunks, parents = [], []
+        for doc_idx, doc in enumerate(self.documents):
+            lines = [line.strip() for line in doc["content"].strip().splitlines() if line.strip()]
+            heading, bullets = (lines[0], lines[1:]) if len(lines) > 1 else ("", lines)
+            
+            current, current_tokens = [], 0
+            for bullet in bullets:
+                bullet_tokens = len(_tokenize(bullet))
+                if current and current_tokens + bullet_tokens > self.CHUNK_TOKENS:
+                    chunks.append("\n".join([heading] + current).strip())
+                    parents.append(doc_idx)
+                    # Keep trailing bullets up to the overlap budget
+                    overlap, overlap_tokens = [], 0
+                    for previous in reversed(current):
+                        overlap_tokens += len(_tokenize(previous))
+                        if overlap_tokens > self.CHUNK_OVERLAP_TOKENS:
+                            break
+                        overlap.insert(0, previous)
+                    current, current_tokens = overlap, sum(len(_tokenize(b)) for b in overlap)
+                current.append(bullet)
+                current_tokens += bullet_tokens
+            if current or heading:
+                chunks.append("\n".join([heading] + current).strip())
+                parents.append(doc_idx)
+        return chunks, np.array(parents, dtype=np.int32)
+    
+    def _cache_path(self) -> Path:
+        """Index file keyed by model, encoder/index settings and document content"""
+        key_source = json.dumps(
+            [self.MODEL_NAME, self.QUANTIZE_ENCODER, self.INDEX_LAYOUT,
+             self.FLAT_INDEX_MAX_DOCS, self.CHUNK_TOKENS, self.CHUNK_OVERLAP_TOKENS,
+             self.documents],
+            sort_keys=True
+        )
+        key = hashlib.sha256(key_source.encode()).hexdigest()[:16]
+        return self.CACHE_DIR / f"rag_{key}.faiss"
+    
+    def _load_cached_index(self) -> bool:
+        index_path = self._cache_path()
+        if not index_path.exists():
+            return False
+        try:
+            # Memory-mapped so every worker maps the same file and the codes live
+            # once in the page cache instead of once per process. IO_FLAG_MMAP
+            # only maps IVF inverted lists; the flat code array of the
+            # scalar-quantized layout is mapped in place by IO_FLAG_MMAP_IFC
+            if len(self.document_texts) < self.FLAT_INDEX_MAX_DOCS:
+                io_flags = faiss.IO_FLAG_MMAP_IFC
+            else:
+                io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            self.index = faiss.read_index(str(index_path), io_flags)
+            return True
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable RAG cache: {e}")
+            self.index = None
+            return False
+    
+    def _save_cached_index(self) -> bool:
+        index_path = self._cache_path()
+        try:
+            self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Write then rename: other workers may have the old file mapped
+            tmp_path = index_path.with_suffix(".tmp")
+            faiss.write_index(self.index, str(tmp_path))
+            tmp_path.replace(index_path)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not write RAG cache: {e}")
+            return False
+    
+    def _query_cache_path(self) -> Path:
+        # Same key as the index: cached embeddings are only valid for that model/corpus
+        return self._cache_path().with_suffix(".queries.pkl")
+    
+    def _load_query_cache(self):
+        path = self._query_cache_path()
+        if not path.exists():
+            return
+        try:
+            self.query_cache.load(path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable RAG query cache: {e}")
+    
+    def save_query_cache(self):
+        """Persist the semantic query cache so it survives restarts"""
+        if self.index is None:
+            return
+        try:
+            self.query_cache.save(self._query_cache_path())
+        except Exception as e:
+            logger.warning(f"Could not write RAG query cache: {e}")
+    
+    def _quantize_model(self, model):
+        """Swap the transformer's Linear layers for dynamically quantized INT8 ones"""
+        if model.device.type != "cpu":
+            return
+        try:
+            transformer = model._first_module()
+            transformer.auto_model = torch.quantization.quantize_dynamic(
+                transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            logger.info("Sentence encoder quantized to INT8")
+        except Exception as e:
+            logger.warning(f"INT8 quantization failed - using FP32 encoder: {e}")
+    
+    def _build_index(self, embeddings: np.ndarray):
+        """Inner-product FAISS index over normalized embeddings"""
+        n, dim = embeddings.shape
+        if n < self.FLAT_INDEX_MAX_DOCS:
+            # One byte per dimension (per-dimension min/max trained); queries stay float
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit,
+                                               faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+        else:
+            # IVF limits each query to nprobe cells; PQ codes replace float distances
+            quantizer = faiss.IndexFlatIP(dim)
+            nlist = int(4 * math.sqrt(n))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, self.PQ_SUBQUANTIZERS, 8,
+                                     faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+            index.nprobe = self.IVF_NPROBE
+        index.add(embeddings)
+        return index
     
     def retrieve_relevant_documents(self, query: str, top_k: int = 3) -> List[Dict]:
         """
         Retrieve top-k most relevant documents for a query
         Uses FAISS if available, falls back to keyword matching
         """
-        if self.model and self.index:
+        if self.index is not None:
             return self._retrieve_with_faiss(query, top_k)
         else:
             return self._retrieve_with_keywords(query, top_k)
     
+    def retrieve_batch(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """
+        retrieve_relevant_documents for several queries at once
+        With FAISS, all queries share one encode and one index search
+        """
+        if not queries:
+            return []
+        if self.index is not None:
+            return self._retrieve_batch_with_faiss(queries, top_k)
+        return [self._retrieve_with_keywords(query, top_k) for query in queries]
+    
     def _retrieve_with_faiss(self, query: str, top_k: int) -> List[Dict]:
         """Retrieve using FAISS embeddings"""
+        return self._retrieve_batch_with_faiss([query], top_k)[0]
+    
+    def _retrieve_batch_with_faiss(self, queries: List[str], top_k: int) -> List[List[Dict]]:
+        """Encode and search all queries together; keyword fallback on error"""
         try:
-            query_embedding = self.model.encode([query], convert_to_numpy=True)
-            query_embedding = np.asarray(query_embedding).astype('float32')
+            if self.model is None:
+                self._load_model()
+            query_embeddings = self._encode_queries(queries)
+            
+            # Near-duplicates of recent queries reuse their results
+            batch_results = [self.query_cache.get(embedding, top_k) for embedding in query_embeddings]
+            misses = [i for i, results in enumerate(batch_results) if results is None]
+            if not misses:
+                return batch_results
             
-            distances, indices = self.index.search(query_embedding, top_k)
+            # Scores are cosine similarities; FAISS pads missing hits with -1.
+            # Several chunks can share a document, so over-fetch and keep each
+            # document's best-scoring chunk
+            scores, indices = self.index.search(_aligned_float32(query_embeddings[misses]), top_k * 3)
             
-            results = []
-            for idx in indices[0]:
-                if idx < len(self.documents):
+            for i, row_scores, row_indices in zip(misses, scores, indices):
+                results, seen = [], set()
+                for score, idx in zip(row_scores, row_indices):
+                    if not 0 <= idx < len(self._chunk_parent):
+                        continue
+                    doc_idx = int(self._chunk_parent[idx])
+                    if doc_idx in seen:
+                        continue
+                    seen.add(doc_idx)
                     results.append({
-                        "document": self.documents[idx],
-                        "relevance_score": float(1 / (1 + distances[0][i])),
+                        "document": self.documents[doc_idx],
+                        "relevance_score": float(score),
                     })
+                    if len(results) == top_k:
+                        break
+                batch_results[i] = results
+                self.query_cache.put(query_embeddings[i], top_k, results)
             
-            return results
+            return batch_results
         except Exception as e:
             logger.error(f"FAISS retrieval error: {e}")
-            return self._retrieve_with_keywords(query, top_k)
+            return [self._retrieve_with_keywords(query, top_k) for query in queries]
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Normalized query embeddings; verbatim repeats skip the encoder"""
+        embeddings: List[Optional[np.ndarray]] = []
+        with self._query_embeddings_lock:
+            for query in queries:
+                embedding = self._query_embeddings.get(query)
+                if embedding is not None:
+                    self._query_embeddings.move_to_end(query)
+                embeddings.append(embedding)
+        
+        # Each distinct uncached query is encoded once, even if repeated in the batch
+        misses = list(dict.fromkeys(q for q, embedding in zip(queries, embeddings) if embedding is None))
+        if misses:
+            encoded = dict(zip(misses, self.model.encode(
+                misses, convert_to_numpy=True, batch_size=32, normalize_embeddings=True
+            ).astype('float32', copy=False)))
+            with self._query_embeddings_lock:
+                self._query_embeddings.update(encoded)
+                while len(self._query_embeddings) > self.QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_embeddings.popitem(last=False)
+            embeddings = [encoded[q] if embedding is None else embedding
+                          for q, embedding in zip(queries, embeddings)]
+        
+        return np.stack(embeddings)
     
     def _retrieve_with_keywords(self, query: str, top_k: int) -> List[Dict]:
-        """Fallback keyword-based retrieval"""
-        query_words = set(query.lower().split())
+        """Fallback keyword-based retrieval over the pre-tokenized corpus"""
+        if self._bm25 is not None:
+            return self._retrieve_with_bm25(query, top_k)
         
-        scores = []
-        for i, doc in enumerate(self.documents):
-            doc_text = (doc["title"] + " " + doc["content"]).lower()
-            doc_words = set(doc_text.split())
-            
-            # Calculate Jaccard similarity
-            if doc_words:
-                intersection = len(query_words & doc_words)
-                union = len(query_words | doc_words)
-                score = intersection / union if union > 0 else 0
-                scores.append((score, i))
+        query_words = set(_tokenize(query))
+        query_bits = np.zeros(self._doc_bits.shape[1], dtype=np.uint64)
+        self._set_bits(query_bits, query_words)
+        
+        # Jaccard similarity: |q & d| / (|q| + |d| - |q & d|); out-of-vocabulary
+        # query words only count toward the union
+        intersection = _shared_term_counts(query_bits, self._doc_bits)
+        union = len(query_words) + self._doc_word_counts - intersection
+        jaccard = np.divide(intersection, union, out=np.zeros(len(union)), where=union > 0)
+        
+        scores = [
+            (float(score), i) for i, score in enumerate(jaccard)
+            if self._doc_word_counts[i]
+        ]
         
-        scores.sort(reverse=True)
+        # Heap of top_k instead of sorting every document
         results = []
-        for score, idx in scores[:top_k]:
+        for score, idx in heapq.nlargest(top_k, scores):
             results.append({
                 "document": self.documents[idx],
                 "relevance_score": score,
@@ -412,16 +870,27 @@ class MedicalKnowledgeBase:
         
         return results
     
+    def _retrieve_with_bm25(self, query: str, top_k: int) -> List[Dict]:
+        """BM25 keyword ranking; only the top_k scores are ordered"""
+        scores = self._bm25.get_scores(_tokenize(query))
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        
+        return [
+            {"document": self.documents[idx], "relevance_score": float(scores[idx])}
+            for idx in top
+        ]
+    
     def get_document_by_id(self, doc_id: str) -> Optional[Dict]:
         """Retrieve specific document by ID"""
-        for doc in self.documents:
-            if doc["id"] == doc_id:
-                return doc
-        return None
+        return self._by_id.get(doc_id)
     
     def get_documents_by_category(self, category: str) -> List[Dict]:
         """Get all documents in a category"""
-        return [doc for doc in self.documents if doc["category"] == category]
+        return list(self._by_category.get(category, ()))
 
 
 class RAGSystem:
@@ -430,8 +899,13 @@ class RAGSystem:
     Grounds medical responses in curated knowledge base
     """
     
+    GUIDANCE_CACHE_SIZE = 256
+    
     def __init__(self):
         self.knowledge_base = MedicalKnowledgeBase()
+        # Compiled guidance per retrieved id sequence; small corpus, same docs recur
+        self._guidance_cache: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+        self._guidance_lock = threading.Lock()
     
     def generate_grounded_response(self, query: str, context: Optional[str] = None) -> Dict:
         """
@@ -441,6 +915,14 @@ class RAGSystem:
         # Retrieve relevant documents
         retrieved_docs = self.knowledge_base.retrieve_relevant_documents(query, top_k=3)
         
+        return self._build_response(query, retrieved_docs)
+    
+    def generate_grounded_responses(self, queries: List[str]) -> List[Dict]:
+        """generate_grounded_response for a batch of queries (one encode + search)"""
+        batch_docs = self.knowledge_base.retrieve_batch(queries, top_k=3)
+        return [self._build_response(query, docs) for query, docs in zip(queries, batch_docs)]
+    
+    def _build_response(self, query: str, retrieved_docs: List[Dict]) -> Dict:
         response = {
             "query": query,
             "retrieved_documents": retrieved_docs,
@@ -455,13 +937,23 @@ class RAGSystem:
         if not retrieved_docs:
             return "No specific guidance found for this query."
         
-        guidance_parts = []
-        for doc_info in retrieved_docs:
-            doc = doc_info["document"]
-            guidance_parts.append(f"\n### {doc['title']}")
-            guidance_parts.append(doc["content"])
+        # Ordered, not sorted: the guidance follows retrieval rank
+        key = tuple(doc_info["document"]["id"] for doc_info in retrieved_docs)
+        with self._guidance_lock:
+            guidance = self._guidance_cache.get(key)
+            if guidance is not None:
+                self._guidance_cache.move_to_end(key)
+                return guidance
         
-        return "".join(guidance_parts)
+        blocks = self.knowledge_base.guidance_blocks
+        guidance = "".join([blocks[doc_id] for doc_id in key])
+        
+        with self._guidance_lock:
+            self._guidance_cache[key] = guidance
+            while len(self._guidance_cache) > self.GUIDANCE_CACHE_SIZE:
+                self._guidance_cache.popitem(last=False)
+        
+        return guidance
     
     def get_emergency_protocols(self) -> Dict:
         """Get all emergency protocols"""
@@ -474,3 +966,38 @@ class RAGSystem:
     def get_first_aid_guidance(self, symptom: str) -> Dict:
         """Get first aid guidance for a symptom"""
         return self.generate_grounded_response(symptom)
+    
+    def close(self):
+        """Save state worth keeping across restarts (the semantic query cache)"""
+        self.knowledge_base.save_query_cache()
+
+
+class BatchingRetriever:
+    """
+    Micro-batcher for concurrent RAG lookups from the async API
+    Queries arriving within batch_interval (up to batch_max) are answered by one
+    generate_grounded_responses call in a worker thread
+    sentence-transformers already sorts a batch by length before padding
+    """
+    
+    def __init__(self, rag_system: RAGSystem, batch_interval: float = 0.005, batch_max: int = 32):
+        self.rag_system = rag_system
+        self._batcher = MicroBatcher(self._answer, batch_interval, batch_max)
+    
+    async def submit(self, query: str) -> Dict:
+        """Queue a query for the next batch and wait for its grounded response"""
+        return await self._batcher.submit(query)
+    
+    async def close(self) -> None:
+        """Fail queries still waiting and stop batching (FastAPI shutdown)"""
+        await self._batcher.close()
+    
+    async def _answer(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Run one batched lookup off the event loop and resolve every waiter"""
+        
+        responses = await asyncio.to_thread(
+            self.rag_system.generate_grounded_responses, [query for query, _ in batch]
+        )
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
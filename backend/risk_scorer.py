@@ -5,13 +5,32 @@ Inspired by Health-LLM's confidence scoring mechanism
 """
 
 import logging
+import bisect
 import math
-from typing import Dict, Tuple
+import re
+import numpy as np
+from typing import Dict, List, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+_DIGITS_RE = re.compile(r"(\d+)")
+
+# Duration units found in one pass; when several appear the earliest unit in
+# _DURATION_PRIORITY decides the score ("hours" is tried before "hour")
+_DURATION_RE = re.compile(
+    r"(?P<minutes>minutes)|(?P<hours>hours)|(?P<hour>hour)|(?P<day>day)|(?P<week>week)|(?P<month>month)"
+)
+_DURATION_PRIORITY = ("minutes", "hour", "hours", "day", "week", "month")
+_DURATION_SCORES = {
+    "minutes": 0.1,  # Recent onset, low risk
+    "hour": 0.1,
+    "hours": 0.2,  # Several hours
+    "week": 0.8,
+    "month": 0.9,
+}
+
 
 class UrgencyLevel(Enum):
     """Urgency classification"""
@@ -20,7 +39,34 @@ class UrgencyLevel(Enum):
     RED = ("emergency", 1.0, "🔴")
 
 
-@dataclass
+# Fixed recommendation text per urgency level, shared by every assessment
+_RECOMMENDATIONS = {
+    UrgencyLevel.RED: (
+        "🚨 EMERGENCY - CALL 911 IMMEDIATELY",
+        "Do not drive to the hospital - call an ambulance",
+        "Have insurance information and medication list ready",
+        "If possible, have someone stay with you",
+        "Keep this assessment record for paramedics",
+    ),
+    UrgencyLevel.YELLOW: (
+        "🟡 Moderate Urgency - Visit doctor or urgent care soon",
+        "Schedule appointment or visit walk-in clinic today/tomorrow",
+        "Monitor your condition closely for any worsening",
+        "Keep hydrated and rest",
+        "Avoid driving if dizzy or impaired",
+        "Have your medical history and medications available",
+    ),
+    UrgencyLevel.GREEN: (
+        "🟢 Mild - Home care may be sufficient",
+        "Rest, hydration, and over-the-counter care if needed",
+        "Monitor symptoms - seek care if worsening",
+        "Contact primary care doctor if symptoms persist >48 hours",
+        "Avoid self-medication without consulting pharmacist",
+        "Stay home if fever/infectious symptoms to prevent spread",
+    ),
+}
+
+@dataclass(slots=True, frozen=True)
 class RiskScore:
     """Risk assessment result"""
     overall_score: float  # 0-1
@@ -30,7 +76,7 @@ class RiskScore:
     duration_score: float  # 0-1
     urgency_level: UrgencyLevel
     reasoning: str
-    recommendations: list
+    recommendations: Tuple[str, ...]
     
 
 class RiskScorer:
@@ -55,18 +101,27 @@ class RiskScorer:
         "high_risk": 1.0,
     }
     
-    # Symptoms that increase urgency
-    HIGH_URGENCY_SYMPTOMS = {
-        "chest_pain", "difficulty_breathing", "unconscious", "seizure",
-        "heavy_bleeding", "stroke_symptoms", "severe_trauma", "poisoning",
-        "anaphylaxis", "severe_allergic_reaction", "choking", "cardiac_symptoms",
-    }
+    # Symptoms that increase urgency (spaced as they appear in symptom text)
+    HIGH_URGENCY_SYMPTOMS = frozenset({
+        "chest pain", "difficulty breathing", "unconscious", "seizure",
+        "heavy bleeding", "stroke symptoms", "severe trauma", "poisoning",
+        "anaphylaxis", "severe allergic reaction", "choking", "cardiac symptoms",
+    })
     
-    MODERATE_URGENCY_SYMPTOMS = {
-        "high_fever", "severe_vomiting", "severe_diarrhea", "severe_dehydration",
-        "severe_abdominal_pain", "severe_head_pain", "severe_injury",
-        "uncontrolled_bleeding", "severe_breathing_difficulty",
-    }
+    MODERATE_URGENCY_SYMPTOMS = frozenset({
+        "high fever", "severe vomiting", "severe diarrhea", "severe dehydration",
+        "severe abdominal pain", "severe head pain", "severe injury",
+        "uncontrolled bleeding", "severe breathing difficulty",
+    })
+    
+    # One compiled alternation per tier, so a single scan of the symptom text
+    # replaces a substring search per symptom
+    _HIGH_URGENCY_RE = re.compile("|".join(
+        re.escape(symptom) for symptom in sorted(HIGH_URGENCY_SYMPTOMS)
+    ))
+    _MODERATE_URGENCY_RE = re.compile("|".join(
+        re.escape(symptom) for symptom in sorted(MODERATE_URGENCY_SYMPTOMS)
+    ))
     
     # Chronic conditions that increase risk
     CHRONIC_CONDITIONS_RISK = {
@@ -78,41 +133,56 @@ class RiskScorer:
         "kidney_disease": 0.18,
     }
     
+    # WEIGHTS in component order, for calculate_risk and calculate_risk_batch to unpack
+    _WEIGHT_VALUES = (
+        WEIGHTS["symptom_severity"], WEIGHTS["chronic_disease"],
+        WEIGHTS["symptom_count"], WEIGHTS["duration"],
+    )
+    # Scores at or above each threshold move up one level
+    _URGENCY_THRESHOLDS = (SEVERITY_THRESHOLDS["moderate_risk"], SEVERITY_THRESHOLDS["high_risk"])
+    _URGENCY_LEVELS = (UrgencyLevel.GREEN, UrgencyLevel.YELLOW, UrgencyLevel.RED)
+    
     def calculate_risk(self, patient_profile) -> RiskScore:
         """
         Calculate overall risk score from patient profile
         Returns RiskScore with breakdown and urgency level
         """
         
+        # Profile fields read by several helpers, looked up once
+        additional_symptoms = patient_profile.additional_symptoms or ()
+        symptom_count = len(additional_symptoms)
+        
+        # Conditions the patient has, collected once for scoring and reasoning
+        active_conditions = tuple(
+            condition for condition, has_condition in (patient_profile.medical_history or {}).items()
+            if has_condition
+        )
+        
         # Component scores
-        symptom_severity_score = self._calculate_symptom_severity(patient_profile)
-        chronic_disease_score = self._calculate_chronic_disease_score(patient_profile)
-        symptom_count_score = self._calculate_symptom_count_score(patient_profile)
+        symptom_severity_score = self._calculate_symptom_severity(patient_profile, additional_symptoms)
+        chronic_disease_score = self._calculate_chronic_disease_score(active_conditions)
+        symptom_count_score = self._calculate_symptom_count_score(symptom_count)
         duration_score = self._calculate_duration_score(patient_profile)
         
         # Weighted overall score
+        severity_weight, chronic_weight, count_weight, duration_weight = self._WEIGHT_VALUES
         overall_score = (
-            self.WEIGHTS["symptom_severity"] * symptom_severity_score +
-            self.WEIGHTS["chronic_disease"] * chronic_disease_score +
-            self.WEIGHTS["symptom_count"] * symptom_count_score +
-            self.WEIGHTS["duration"] * duration_score
+            severity_weight * symptom_severity_score +
+            chronic_weight * chronic_disease_score +
+            count_weight * symptom_count_score +
+            duration_weight * duration_score
         )
         
         # Clamp to 0-1
         overall_score = min(1.0, max(0.0, overall_score))
         
         # Determine urgency level
-        if overall_score >= self.SEVERITY_THRESHOLDS["high_risk"]:
-            urgency_level = UrgencyLevel.RED
-        elif overall_score >= self.SEVERITY_THRESHOLDS["moderate_risk"]:
-            urgency_level = UrgencyLevel.YELLOW
-        else:
-            urgency_level = UrgencyLevel.GREEN
+        urgency_level = self._URGENCY_LEVELS[bisect.bisect_right(self._URGENCY_THRESHOLDS, overall_score)]
         
         # Generate reasoning and recommendations
         reasoning = self._generate_reasoning(
             overall_score, symptom_severity_score, chronic_disease_score,
-            symptom_count_score, duration_score, patient_profile
+            symptom_count_score, duration_score, active_conditions, symptom_count
         )
         
         recommendations = self._generate_recommendations(
@@ -130,7 +200,53 @@ class RiskScorer:
             recommendations=recommendations,
         )
     
-    def _calculate_symptom_severity(self, patient_profile) -> float:
+    def calculate_risk_batch(self, patient_profiles: List) -> np.ndarray:
+        """
+        Overall risk scores for many patients at once (cohort re-scoring)
+        Bit-identical to calculate_risk(...).overall_score (sums are taken in
+        the same order), so threshold cases get the same urgency level
+        """
+        if not patient_profiles:
+            return np.zeros(0)
+        
+        # Text-derived components are still parsed per patient
+        severity = np.array([
+            self._calculate_symptom_severity(p, p.additional_symptoms or ()) for p in patient_profiles
+        ])
+        duration = np.array([self._calculate_duration_score(p) for p in patient_profiles])
+        # Summed in each patient's own history order, as calculate_risk does
+        chronic = np.array([
+            self._calculate_chronic_disease_score(tuple(
+                condition for condition, has_condition in (p.medical_history or {}).items()
+                if has_condition
+            ))
+            for p in patient_profiles
+        ])
+        
+        counts = np.array([len(p.additional_symptoms or []) for p in patient_profiles])
+        symptom_count = np.select(
+            [counts == 0, counts == 1, counts <= 3],
+            [0.0, 0.1, 0.3],
+            np.minimum(1.0, 0.7 + (counts - 3) * 0.1),
+        )
+        
+        # Element-wise terms added left to right; a matrix product would sum
+        # in BLAS order and can differ from calculate_risk in the last bit
+        severity_weight, chronic_weight, count_weight, duration_weight = self._WEIGHT_VALUES
+        overall = (
+            severity_weight * severity +
+            chronic_weight * chronic +
+            count_weight * symptom_count +
+            duration_weight * duration
+        )
+        return np.clip(overall, 0.0, 1.0)
+    
+    def urgency_levels_batch(self, overall_scores: np.ndarray) -> List[UrgencyLevel]:
+        """UrgencyLevel for each score from calculate_risk_batch"""
+        levels = np.digitize(overall_scores, self._URGENCY_THRESHOLDS)
+        return [self._URGENCY_LEVELS[level] for level in levels]
+    
+    def _calculate_symptom_severity(self, patient_profile, additional_symptoms) -> float:
         """
         Calculate severity score based on:
         1. Self-reported severity (0-10 scale)
@@ -139,51 +255,39 @@ class RiskScorer:
         base_score = patient_profile.severity_score / 10.0
         
         # Check for high-urgency symptoms
-        symptoms_text = (
-            (patient_profile.primary_symptom or "").lower() +
-            " " +
-            " ".join(patient_profile.additional_symptoms or []).lower()
+        symptoms_text = " ".join(
+            [patient_profile.primary_symptom or "", *additional_symptoms]
         ).lower()
         
         symptom_multiplier = 1.0
         
-        for symptom in self.HIGH_URGENCY_SYMPTOMS:
-            if symptom.replace("_", " ") in symptoms_text:
-                symptom_multiplier = 1.5
-                break
-        
-        if symptom_multiplier == 1.0:
-            for symptom in self.MODERATE_URGENCY_SYMPTOMS:
-                if symptom.replace("_", " ") in symptoms_text:
-                    symptom_multiplier = 1.2
-                    break
+        if self._HIGH_URGENCY_RE.search(symptoms_text):
+            symptom_multiplier = 1.5
+        elif self._MODERATE_URGENCY_RE.search(symptoms_text):
+            symptom_multiplier = 1.2
         
         severity_score = min(1.0, base_score * symptom_multiplier)
         return severity_score
     
-    def _calculate_chronic_disease_score(self, patient_profile) -> float:
+    def _calculate_chronic_disease_score(self, active_conditions: Tuple[str, ...]) -> float:
         """
         Calculate risk increase from chronic conditions
         Multiple conditions increase risk exponentially
         """
-        if not patient_profile.medical_history:
-            return 0.0
-        
-        total_risk = 0.0
-        for condition, has_condition in patient_profile.medical_history.items():
-            if has_condition and condition in self.CHRONIC_CONDITIONS_RISK:
-                total_risk += self.CHRONIC_CONDITIONS_RISK[condition]
+        total_risk = sum(
+            self.CHRONIC_CONDITIONS_RISK[condition]
+            for condition in active_conditions
+            if condition in self.CHRONIC_CONDITIONS_RISK
+        )
         
         # Cap at 1.0, but allow stacking of conditions
         return min(1.0, total_risk)
     
-    def _calculate_symptom_count_score(self, patient_profile) -> float:
+    def _calculate_symptom_count_score(self, symptom_count: int) -> float:
         """
         Calculate score based on number of symptoms
         Multiple symptoms increase risk
         """
-        symptom_count = len(patient_profile.additional_symptoms or [])
-        
         # Non-linear increase: 0 symptoms = 0, 1 = 0.1, 2-3 = 0.3, 4+ = 0.7
         if symptom_count == 0:
             return 0.0
@@ -202,14 +306,16 @@ class RiskScorer:
         duration_text = (patient_profile.duration or "").lower()
         
         # Parsing duration
-        if "minutes" in duration_text or "hour" in duration_text and "hours" not in duration_text:
-            return 0.1  # Recent onset, low risk
-        elif "hours" in duration_text:
-            return 0.2  # Several hours
-        elif "day" in duration_text:
+        units = {match.lastgroup for match in _DURATION_RE.finditer(duration_text)}
+        if "hours" in units:
+            units.discard("hour")  # "1 hour" only means recent onset on its own
+        unit = next((unit for unit in _DURATION_PRIORITY if unit in units), None)
+        
+        if unit is None:
+            return 0.2  # Unknown duration, assume recent
+        if unit == "day":
             # Parse number of days
-            import re
-            match = re.search(r'(\d+)', duration_text)
+            match = _DIGITS_RE.search(duration_text)
             if match:
                 days = int(match.group(1))
                 if days <= 3:
@@ -219,16 +325,11 @@ class RiskScorer:
                 else:
                     return 0.7
             return 0.4
-        elif "week" in duration_text:
-            return 0.8
-        elif "month" in duration_text or "months" in duration_text:
-            return 0.9
-        else:
-            return 0.2  # Unknown duration, assume recent
+        return _DURATION_SCORES[unit]
     
     def _generate_reasoning(
         self, overall_score, symptom_score, disease_score,
-        count_score, duration_score, patient_profile
+        count_score, duration_score, active_conditions, symptom_count
     ) -> str:
         """Generate human-readable reasoning for risk score"""
         
@@ -242,16 +343,12 @@ class RiskScorer:
         
         # Chronic diseases
         if disease_score > 0:
-            active_conditions = [
-                cond.replace("_", " ").title()
-                for cond, has_cond in patient_profile.medical_history.items()
-                if has_cond
-            ]
-            reasons.append(f"Chronic conditions increase risk: {', '.join(active_conditions)} (score: {disease_score:.2f})")
+            condition_names = [cond.replace("_", " ").title() for cond in active_conditions]
+            reasons.append(f"Chronic conditions increase risk: {', '.join(condition_names)} (score: {disease_score:.2f})")
         
         # Multiple symptoms
         if count_score >= 0.3:
-            reasons.append(f"Multiple symptoms present ({len(patient_profile.additional_symptoms)} additional symptoms)")
+            reasons.append(f"Multiple symptoms present ({symptom_count} additional symptoms)")
         
         # Duration
         if duration_score >= 0.5:
@@ -262,41 +359,9 @@ class RiskScorer:
     
     def _generate_recommendations(
         self, urgency_level: UrgencyLevel, patient_profile, overall_score
-    ) -> list:
+    ) -> Tuple[str, ...]:
         """Generate action recommendations based on risk level"""
-        
-        recommendations = []
-        
-        if urgency_level == UrgencyLevel.RED:
-            recommendations = [
-                "🚨 EMERGENCY - CALL 911 IMMEDIATELY",
-                "Do not drive to the hospital - call an ambulance",
-                "Have insurance information and medication list ready",
-                "If possible, have someone stay with you",
-                "Keep this assessment record for paramedics",
-            ]
-        
-        elif urgency_level == UrgencyLevel.YELLOW:
-            recommendations = [
-                "🟡 Moderate Urgency - Visit doctor or urgent care soon",
-                "Schedule appointment or visit walk-in clinic today/tomorrow",
-                "Monitor your condition closely for any worsening",
-                "Keep hydrated and rest",
-                "Avoid driving if dizzy or impaired",
-                "Have your medical history and medications available",
-            ]
-        
-        else:  # GREEN
-            recommendations = [
-                "🟢 Mild - Home care may be sufficient",
-                "Rest, hydration, and over-the-counter care if needed",
-                "Monitor symptoms - seek care if worsening",
-                "Contact primary care doctor if symptoms persist >48 hours",
-                "Avoid self-medication without consulting pharmacist",
-                "Stay home if fever/infectious symptoms to prevent spread",
-            ]
-        
-        return recommendations
+        return _RECOMMENDATIONS[urgency_level]
 
 
 class SeverityAnalyzer:
@@ -305,24 +370,27 @@ class SeverityAnalyzer:
     Used for edge cases and multi-symptom evaluation
     """
     
+    # Each combination is serious when every term appears in some reported symptom
+    _SERIOUS_COMBINATIONS = tuple(
+        (primary, *secondary) for primary, secondary in (
+            ("chest pain", ("difficulty breathing", "dizziness")),
+            ("difficulty breathing", ("chest pain", "dizziness")),
+            ("severe headache", ("fever", "stiff neck")),
+            ("confusion", ("high fever", "difficulty breathing")),
+        )
+    )
+    
     @staticmethod
     def is_potentially_serious(primary_symptom: str, additional_symptoms: list) -> bool:
         """Quick check if combination seems serious"""
         
-        serious_combinations = {
-            ("chest pain", ["difficulty breathing", "dizziness"]),
-            ("difficulty breathing", ["chest pain", "dizziness"]),
-            ("severe headache", ["fever", "stiff neck"]),
-            ("confusion", ["high fever", "difficulty breathing"]),
-        }
-        
-        symptom_set = set([s.lower() for s in [primary_symptom] + (additional_symptoms or [])])
+        symptoms = {s.lower() for s in [primary_symptom or ""] + list(additional_symptoms or [])}
         
-        for combo in serious_combinations:
-            if all(s.lower() in " ".join(symptom_set) for s in combo):
-                return True
-        
-        return False
+        # Terms are matched within a single symptom, never across two of them
+        return any(
+            all(any(term in symptom for symptom in symptoms) for term in combo)
+            for combo in SeverityAnalyzer._SERIOUS_COMBINATIONS
+        )
     
     @staticmethod
     def assess_dehydration_risk(symptoms: list, duration_hours: float) -> float:
@@ -0,0 +1,78 @@
+"""
+Session storage for the triage API
+In-process dict by default; Redis when REDIS_URL is set so every
+uvicorn worker sees the same sessions
+"""
+
+import os
+import pickle
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+SESSION_TTL = 3600  # seconds a session survives without activity
+
+
+class InMemorySessionStore:
+    """
+    Sessions held in this process only (single worker)
+    get() returns the stored dict itself, but callers still set() after
+    changing it so the same code works against Redis
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        return self._sessions.get(session_id)
+
+    async def set(self, session_id: str, session: Dict) -> None:
+        self._sessions[session_id] = session
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisSessionStore:
+    """
+    Sessions shared across workers through Redis
+    Whole session dicts are pickled because they hold RiskScore objects
+    """
+
+    def __init__(self, url: str, ttl: int = SESSION_TTL):
+        self.ttl = ttl
+        self._redis = aioredis.from_url(url, decode_responses=False)
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"sess:{session_id}"
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        data = await self._redis.get(self._key(session_id))
+        return pickle.loads(data) if data is not None else None
+
+    async def set(self, session_id: str, session: Dict) -> None:
+        data = pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+        await self._redis.set(self._key(session_id), data, ex=self.ttl)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_session_store():
+    """Redis-backed store when REDIS_URL is configured, otherwise in-memory"""
+
+    url = os.getenv("REDIS_URL")
+    if url and REDIS_AVAILABLE:
+        logger.info("Using Redis session store")
+        return RedisSessionStore(url)
+    if url:
+        logger.warning("REDIS_URL set but redis is not installed - using in-memory sessions")
+    return InMemorySessionStore()
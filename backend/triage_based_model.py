@@ -9,10 +9,38 @@ Key Difference:
 """
 
 import logging
-from typing import List, Dict, Optional
+import re
+from functools import lru_cache
+from typing import List, Dict, Optional, Set
 
 logger = logging.getLogger(__name__)
 
+_SEPARATOR = "=" * 60
+
+_URGENCY_LEVELS = ("green", "yellow", "red")
+_URGENCY_RANK = {level: rank for rank, level in enumerate(_URGENCY_LEVELS)}
+
+# Fixed next-step text per urgency level, shared by every assessment
+_NEXT_STEPS = {
+    "red": (
+        "🚨 EMERGENCY - CALL 911 IMMEDIATELY",
+        "Do not drive if symptoms present",
+        "Have insurance information ready"
+    ),
+    "yellow": (
+        "🟡 Schedule doctor appointment within 24 hours",
+        "Visit urgent care clinic if cannot see regular doctor",
+        "Monitor symptoms for any worsening",
+        "Stay home if contagious symptoms present"
+    ),
+    "green": (
+        "🟢 Home care measures appropriate",
+        "Rest, hydration, basic comfort measures",
+        "Monitor symptoms - see doctor if worsening or persistent",
+        "Schedule regular appointment if symptoms continue >48 hours"
+    ),
+}
+
 
 class TriageBasedAssessment:
     """
@@ -145,21 +173,18 @@ class TriageBasedAssessment:
     }
     
     @staticmethod
+    @lru_cache(maxsize=256)
     def get_symptom_questions(symptom: str) -> List[str]:
-        """Get question tree for a symptom"""
-        
-        symptom_lower = symptom.lower()
+        """
+        Get question tree for a symptom
+        Cached per symptom string; the returned list is shared, don't mutate it
+        """
         
-        if "headache" in symptom_lower or "head pain" in symptom_lower:
-            return TriageBasedAssessment.HEADACHE_QUESTIONS
-        elif "chest" in symptom_lower or "heart" in symptom_lower:
-            return TriageBasedAssessment.CHEST_PAIN_QUESTIONS
-        elif "abdominal" in symptom_lower or "belly" in symptom_lower or "stomach" in symptom_lower:
-            return TriageBasedAssessment.ABDOMINAL_PAIN_QUESTIONS
-        elif "fever" in symptom_lower or "temperature" in symptom_lower:
-            return TriageBasedAssessment.FEVER_QUESTIONS
-        elif "breath" in symptom_lower or "shortness" in symptom_lower:
-            return TriageBasedAssessment.SHORTNESS_OF_BREATH_QUESTIONS
+        # Earliest route in _SYMPTOM_ROUTES wins when several triggers appear
+        routes = [_SYMPTOM_ROUTE_INDEX[match.group(1)]
+                  for match in _SYMPTOM_TRIGGER_RE.finditer(symptom.lower())]
+        if routes:
+            return _SYMPTOM_ROUTES[min(routes)][1]
         else:
             return [f"Describe your {symptom} in more detail",
                     "When did this start?",
@@ -189,6 +214,7 @@ class TriageBasedAssessment:
         """
         
         answers_combined = " ".join(answers).lower()
+        present_terms = _find_pattern_terms(answers_combined)
         
         assessment = {
             "symptom": symptom,
@@ -201,72 +227,43 @@ class TriageBasedAssessment:
                          "Always consult healthcare professionals for proper diagnosis."
         }
         
-        # Pattern matching - calculate confidence for each condition
-        condition_scores = {}
+        # Pattern matching - calculate confidence for each condition and
+        # collect red flags in the same pass; urgency tracked as 0/1/2
+        condition_scores = []  # (confidence, condition index)
+        urgency_rank = 0
         
-        for condition, pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.items():
+        for i in range(len(_CONDITION_NAMES)):
             # Count keyword matches
-            matches = sum(1 for keyword in pattern["keywords"] if keyword in answers_combined)
-            if len(pattern["keywords"]) > 0:
-                confidence = matches / len(pattern["keywords"])
+            if _CONDITION_KEYWORD_COUNTS[i] > 0:
+                confidence = len(_CONDITION_KEYWORDS[i] & present_terms) / _CONDITION_KEYWORD_COUNTS[i]
             else:
                 confidence = 0
             
             # Store scores
             if confidence > 0.4:  # Only include if >40% match
-                condition_scores[condition] = {
-                    "confidence": f"{int(confidence*100)}%",
-                    "description": pattern["description"],
-                    "actions": pattern["actions"],
-                    "urgency": pattern["urgency"]
-                }
+                condition_scores.append((confidence, i))
+                urgency_rank = max(urgency_rank, _CONDITION_URGENCY[i])
+            
+            # Check for red flags
+            for red_flag in _CONDITION_RED_FLAGS[i]:
+                if red_flag in present_terms:
+                    assessment["red_flags_present"].append(red_flag)
+                    if _CONDITION_URGENCY[i] == 2:
+                        urgency_rank = 2
+        
+        assessment["urgency_level"] = _URGENCY_LEVELS[urgency_rank]
         
         # Sort by confidence and add to results
-        for condition, score in sorted(condition_scores.items(), 
-                                      key=lambda x: int(x[1]["confidence"].rstrip("%")), 
-                                      reverse=True):
+        for confidence, i in sorted(condition_scores, key=lambda x: x[0], reverse=True):
             assessment["possible_conditions"].append({
-                "condition": condition,
-                "confidence": score["confidence"],
-                "description": score["description"],
-                "recommended_actions": score["actions"]
+                "condition": _CONDITION_NAMES[i],
+                "confidence": f"{int(confidence*100)}%",
+                "description": _CONDITION_DESCRIPTIONS[i],
+                "recommended_actions": _CONDITION_ACTIONS[i]
             })
-            
-            # Update urgency to highest (most severe)
-            if score["urgency"] == "red":
-                assessment["urgency_level"] = "red"
-            elif score["urgency"] == "yellow" and assessment["urgency_level"] == "green":
-                assessment["urgency_level"] = "yellow"
-        
-        # Check for red flags
-        for condition, pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.items():
-            for red_flag in pattern.get("red_flags", []):
-                if red_flag in answers_combined:
-                    assessment["red_flags_present"].append(red_flag)
-                    if pattern["urgency"] == "red":
-                        assessment["urgency_level"] = "red"
         
         # Generate next steps based on urgency
-        if assessment["urgency_level"] == "red":
-            assessment["next_steps"] = [
-                "🚨 EMERGENCY - CALL 911 IMMEDIATELY",
-                "Do not drive if symptoms present",
-                "Have insurance information ready"
-            ]
-        elif assessment["urgency_level"] == "yellow":
-            assessment["next_steps"] = [
-                "🟡 Schedule doctor appointment within 24 hours",
-                "Visit urgent care clinic if cannot see regular doctor",
-                "Monitor symptoms for any worsening",
-                "Stay home if contagious symptoms present"
-            ]
-        else:
-            assessment["next_steps"] = [
-                "🟢 Home care measures appropriate",
-                "Rest, hydration, basic comfort measures",
-                "Monitor symptoms - see doctor if worsening or persistent",
-                "Schedule regular appointment if symptoms continue >48 hours"
-            ]
+        assessment["next_steps"] = _NEXT_STEPS[assessment["urgency_level"]]
         
         return assessment
     
@@ -276,30 +273,99 @@ class TriageBasedAssessment:
         Generate readable summary of assessment
         """
         
-        summary = f"\n{'='*60}\n"
-        summary += "TRIAGE ASSESSMENT SUMMARY\n"
-        summary += f"{'='*60}\n\n"
+        parts = []
+        append = parts.append
         
-        summary += f"Symptom: {assessment['symptom']}\n"
-        summary += f"Urgency Level: {assessment['urgency_level'].upper()}\n\n"
+        append(f"\n{_SEPARATOR}\n")
+        append("TRIAGE ASSESSMENT SUMMARY\n")
+        append(f"{_SEPARATOR}\n\n")
+        
+        append(f"Symptom: {assessment['symptom']}\n")
+        append(f"Urgency Level: {assessment['urgency_level'].upper()}\n\n")
         
         if assessment["possible_conditions"]:
-            summary += "Possible Conditions:\n"
+            append("Possible Conditions:\n")
             for i, cond in enumerate(assessment["possible_conditions"], 1):
-                summary += f"  {i}. {cond['condition'].title()} ({cond['confidence']} confidence)\n"
-                summary += f"     {cond['description']}\n\n"
+                append(f"  {i}. {cond['condition'].title()} ({cond['confidence']} confidence)\n")
+                append(f"     {cond['description']}\n\n")
         
         if assessment["red_flags_present"]:
-            summary += "🚨 Red Flags Identified:\n"
+            append("🚨 Red Flags Identified:\n")
             for flag in assessment["red_flags_present"]:
-                summary += f"  - {flag}\n"
-            summary += "\n"
+                append(f"  - {flag}\n")
+            append("\n")
         
-        summary += "Recommended Actions:\n"
+        append("Recommended Actions:\n")
         for action in assessment["next_steps"]:
-            summary += f"  {action}\n"
+            append(f"  {action}\n")
         
-        summary += f"\n{assessment['disclaimer']}\n"
-        summary += f"{'='*60}\n"
+        append(f"\n{assessment['disclaimer']}\n")
+        append(f"{_SEPARATOR}\n")
         
-        return summary
+        return "".join(parts)
+
+
+def _compile_pattern_terms(patterns: Dict):
+    """
+    One regex over every keyword and red flag in the assessment patterns
+    Terms match whole words only ("panic" not inside "hispanic"). A zero-width
+    lookahead reports a term at each position it starts, longest first; shorter
+    terms that end on a word boundary inside the hit are implied alongside it
+    """
+    terms = sorted(
+        {term for pattern in patterns.values() for term in pattern["keywords"] + pattern.get("red_flags", [])},
+        key=len, reverse=True
+    )
+    regex = re.compile(r"(?<!\w)(?=(" + "|".join(map(re.escape, terms)) + r")(?!\w))")
+    implied = {
+        term: {other for other in terms
+               if term == other or (term.startswith(other) and not term[len(other)].isalnum()
+                                    and term[len(other)] != "_")}
+        for term in terms
+    }
+    return regex, implied
+
+
+# Question trees by trigger, in the priority get_symptom_questions applies
+_SYMPTOM_ROUTES = (
+    (("headache", "head pain"), TriageBasedAssessment.HEADACHE_QUESTIONS),
+    (("chest", "heart"), TriageBasedAssessment.CHEST_PAIN_QUESTIONS),
+    (("abdominal", "belly", "stomach"), TriageBasedAssessment.ABDOMINAL_PAIN_QUESTIONS),
+    (("fever", "temperature"), TriageBasedAssessment.FEVER_QUESTIONS),
+    (("breath", "shortness"), TriageBasedAssessment.SHORTNESS_OF_BREATH_QUESTIONS),
+)
+_SYMPTOM_ROUTE_INDEX = {trigger: i for i, (triggers, _) in enumerate(_SYMPTOM_ROUTES) for trigger in triggers}
+# Lookahead so overlapping triggers at different positions are all reported
+_SYMPTOM_TRIGGER_RE = re.compile(
+    "(?=(" + "|".join(map(re.escape, sorted(_SYMPTOM_ROUTE_INDEX, key=len, reverse=True))) + "))"
+)
+
+_PATTERN_TERM_RE, _PATTERN_TERM_IMPLIED = _compile_pattern_terms(TriageBasedAssessment.ASSESSMENT_PATTERNS)
+
+# ASSESSMENT_PATTERNS flattened into parallel per-condition columns for
+# assess_pattern; the dict stays the editable source
+_CONDITION_NAMES = tuple(TriageBasedAssessment.ASSESSMENT_PATTERNS)
+_CONDITION_KEYWORDS = tuple(
+    frozenset(pattern["keywords"]) for pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.values()
+)
+_CONDITION_KEYWORD_COUNTS = tuple(len(keywords) for keywords in _CONDITION_KEYWORDS)
+_CONDITION_URGENCY = tuple(
+    _URGENCY_RANK[pattern["urgency"]] for pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.values()
+)
+_CONDITION_RED_FLAGS = tuple(
+    tuple(pattern.get("red_flags", [])) for pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.values()
+)
+_CONDITION_DESCRIPTIONS = tuple(
+    pattern["description"] for pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.values()
+)
+_CONDITION_ACTIONS = tuple(
+    pattern["actions"] for pattern in TriageBasedAssessment.ASSESSMENT_PATTERNS.values()
+)
+
+
+def _find_pattern_terms(text: str) -> Set[str]:
+    """Keywords and red flags occurring in text, from a single scan"""
+    present = set()
+    for match in _PATTERN_TERM_RE.finditer(text):
+        present |= _PATTERN_TERM_IMPLIED[match.group(1)]
+    return present
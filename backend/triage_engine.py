@@ -5,23 +5,85 @@ Handles structured doctor-style questioning with dynamic follow-up logic
 Inspired by Health-LLM paper's structured interaction model
 """
 
+import bisect
 import logging
-from enum import Enum
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+import re
+from collections import deque
+from enum import IntEnum
+from functools import lru_cache
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Deque, Dict, List, Optional, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
-class UrgencyLevel(Enum):
-    """Urgency classification levels"""
-    GREEN = "mild"
-    YELLOW = "moderate"
-    RED = "emergency"
+def _trie_pattern(phrases) -> str:
+    """
+    Regex source for a character trie over phrases, so shared prefixes
+    ("chest p..", "severe b..") are matched once before branching
+    A phrase that ends inside another is an optional tail, tried longest first
+    """
+    trie: Dict = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = None  # end of a phrase
+    
+    def emit(node: Dict) -> str:
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+    
+    return emit(trie)
+
+
+class UrgencyLevel(IntEnum):
+    """Urgency classification levels, ordered so levels compare as ints"""
+    GREEN = 1
+    YELLOW = 2
+    RED = 3
+    
+    @property
+    def label(self) -> str:
+        """Display name ("mild", "moderate", "emergency")"""
+        return URGENCY_LABELS[self]
+
+
+URGENCY_LABELS = {
+    UrgencyLevel.GREEN: "mild",
+    UrgencyLevel.YELLOW: "moderate",
+    UrgencyLevel.RED: "emergency",
+}
+
+
+def _resolve_extractors(required_fields, extractors: Dict) -> Tuple:
+    """Extractor functions for required fields, skipping unknown ones"""
+    return tuple(extractors[field] for field in required_fields if field in extractors)
+
+
+def _stage_extractors(flow, extractors: Dict) -> Tuple[Tuple, ...]:
+    """Extractor functions for every stage of a conversation flow, in stage order"""
+    return tuple(_resolve_extractors(stage["required_info"], extractors) for stage in flow)
 
 
-@dataclass
+def _default_medical_history() -> Dict[str, bool]:
+    return {
+        "diabetes": False,
+        "hypertension": False,
+        "asthma": False,
+        "heart_disease": False,
+        "stroke_history": False,
+        "kidney_disease": False,
+    }
+
+
+@dataclass(slots=True)
 class PatientProfile:
     """Patient information collected during triage"""
     age: Optional[int] = None
@@ -29,43 +91,23 @@ class PatientProfile:
     primary_symptom: Optional[str] = None
     duration: Optional[str] = None
     severity_score: float = 0.0
-    medical_history: Dict[str, bool] = None
-    current_medications: List[str] = None
+    medical_history: Dict[str, bool] = field(default_factory=_default_medical_history)
+    current_medications: List[str] = field(default_factory=list)
     recent_meals: Optional[str] = None
-    allergies: List[str] = None
-    additional_symptoms: List[str] = None
-    
-    def __post_init__(self):
-        if self.medical_history is None:
-            self.medical_history = {
-                "diabetes": False,
-                "hypertension": False,
-                "asthma": False,
-                "heart_disease": False,
-                "stroke_history": False,
-                "kidney_disease": False,
-            }
-        if self.current_medications is None:
-            self.current_medications = []
-        if self.allergies is None:
-            self.allergies = []
-        if self.additional_symptoms is None:
-            self.additional_symptoms = []
+    allergies: List[str] = field(default_factory=list)
+    additional_symptoms: List[str] = field(default_factory=list)
 
     def to_dict(self) -> Dict:
-        """Convert to dictionary for logging and storage"""
-        return {
-            "age": self.age,
-            "gender": self.gender,
-            "primary_symptom": self.primary_symptom,
-            "duration": self.duration,
-            "severity_score": self.severity_score,
-            "medical_history": self.medical_history,
-            "current_medications": self.current_medications,
-            "recent_meals": self.recent_meals,
-            "allergies": self.allergies,
-            "additional_symptoms": self.additional_symptoms,
-        }
+        """
+        Convert to dictionary for logging and storage
+        Values are the profile's own objects, not copies (unlike asdict)
+        """
+        return dict(zip(_PROFILE_FIELDS, _get_profile_fields(self)))
+
+
+# Field names in declaration order, read once; new fields are picked up by to_dict
+_PROFILE_FIELDS = tuple(f.name for f in fields(PatientProfile))
+_get_profile_fields = attrgetter(*_PROFILE_FIELDS)
 
 
 class TriageEngine:
@@ -74,95 +116,138 @@ class TriageEngine:
     Mimics doctor's step-by-step questioning pattern
     """
     
-    EMERGENCY_TRIGGERS = {
-        "chest_pain": [
+    EMERGENCY_TRIGGERS = MappingProxyType({
+        "chest_pain": (
             "chest pain", "chest tightness", "chest pressure",
             "radiating pain", "shoulder pain with chest",
-        ],
-        "breathing": [
+        ),
+        "breathing": (
             "difficulty breathing", "shortness of breath", "gasping",
             "severe breathing", "choking",
-        ],
-        "consciousness": [
+        ),
+        "consciousness": (
             "unconscious", "fainted", "collapsed", "passed out",
             "unresponsive", "dizzy with vision loss",
-        ],
-        "seizure": [
+        ),
+        "seizure": (
             "seizure", "convulsion", "shaking", "losing consciousness and shaking",
-        ],
-        "bleeding": [
+        ),
+        "bleeding": (
             "heavy bleeding", "severe bleeding", "uncontrolled bleeding",
             "bleeding from", "gushing blood",
-        ],
-        "stroke": [
+        ),
+        "stroke": (
             "facial drooping", "arm weakness", "speech difficulty",
             "sudden numbness", "loss of balance",
-        ],
-        "severe_trauma": [
+        ),
+        "severe_trauma": (
             "severe burn", "deep cut", "impalement", "severe crush",
             "loss of consciousness from injury",
-        ],
+        ),
+    })
+    
+    # (lowercased trigger, category) pairs, flattened once
+    _FLAT_TRIGGERS = tuple(
+        (trigger.lower(), category)
+        for category, triggers in EMERGENCY_TRIGGERS.items() for trigger in triggers
+    )
+    _TRIGGER_CATEGORIES = dict(_FLAT_TRIGGERS)
+    
+    # Every trigger phrase in one prefix-shared pattern: a single scan of the
+    # input instead of an `in` test per phrase; the logged trigger is the
+    # longest one at the match position
+    _EMERGENCY_TRIGGER_RE = re.compile(_trie_pattern(_TRIGGER_CATEGORIES))
+    
+    # Joins turns in process_batch; never part of a trigger phrase
+    _BATCH_SEPARATOR = "\x00"
+    
+    # Field extractors, compiled once
+    _AGE_RE = re.compile(r'\b(\d{1,3})\b')
+    _SCORE_RE = re.compile(r'(\d+)')
+    # Whole words only, so "female"/"woman" no longer read as male and "i'm"
+    # isn't the letter m
+    _GENDER_RE = re.compile(
+        r"(?<![\w'])(?:(?P<female>female|woman|girl|f)|(?P<male>male|man|boy|m))(?![\w'])"
+    )
+    # Mentioned phrase -> medical_history key; "s?" accepts plurals like "kidneys"
+    _MEDICAL_HISTORY_TERMS = {
+        "diabetes": "diabetes",
+        "high blood pressure": "hypertension",
+        "hypertension": "hypertension",
+        "bp": "hypertension",
+        "asthma": "asthma",
+        "heart": "heart_disease",
+        "cardiac": "heart_disease",
+        "stroke": "stroke_history",
+        "tia": "stroke_history",
+        "kidney": "kidney_disease",
     }
+    _MEDICAL_HISTORY_RE = re.compile(
+        r"\b(" + "|".join(map(re.escape, _MEDICAL_HISTORY_TERMS)) + r")s?\b"
+    )
     
-    SEVERITY_WEIGHTS = {
+    SEVERITY_WEIGHTS = MappingProxyType({
         "symptom_severity": 0.4,
         "chronic_disease": 0.3,
         "symptom_count": 0.15,
         "duration": 0.15,
-    }
+    })
     
-    CONVERSATION_FLOW = [
-        {
+    CONVERSATION_FLOW = (
+        MappingProxyType({
             "stage": "greeting",
             "assistant_message": "Hello. I'm HealthMate, your emergency first-aid assistant. I'm here to help you assess your condition. Please know that I'm not a replacement for a doctor. Let me ask you a few quick questions to understand what's happening.",
-            "required_info": [],
-        },
-        {
+            "required_info": (),
+        }),
+        MappingProxyType({
             "stage": "basic_info",
             "assistant_message": "First, could you please tell me your age and gender?",
-            "required_info": ["age", "gender"],
-        },
-        {
+            "required_info": ("age", "gender"),
+        }),
+        MappingProxyType({
             "stage": "primary_symptom",
             "assistant_message": "What's your main concern or symptom right now?",
-            "required_info": ["primary_symptom"],
-        },
-        {
+            "required_info": ("primary_symptom",),
+        }),
+        MappingProxyType({
             "stage": "symptom_duration",
             "assistant_message": "How long have you been experiencing this symptom?",
-            "required_info": ["duration"],
-        },
-        {
+            "required_info": ("duration",),
+        }),
+        MappingProxyType({
             "stage": "severity_assessment",
             "assistant_message": "On a scale of 1 to 10, how severe would you rate your pain or discomfort? 1 being very mild, 10 being the worst possible.",
-            "required_info": ["severity_score"],
-        },
-        {
+            "required_info": ("severity_score",),
+        }),
+        MappingProxyType({
             "stage": "medical_history",
             "assistant_message": "Do you have any chronic conditions? For example: diabetes, high blood pressure, asthma, or heart disease?",
-            "required_info": ["medical_history"],
-        },
-        {
+            "required_info": ("medical_history",),
+        }),
+        MappingProxyType({
             "stage": "medications",
             "assistant_message": "Are you currently taking any medications? If yes, please list them.",
-            "required_info": ["current_medications"],
-        },
-        {
+            "required_info": ("current_medications",),
+        }),
+        MappingProxyType({
             "stage": "allergies",
             "assistant_message": "Do you have any known allergies to medications?",
-            "required_info": ["allergies"],
-        },
-        {
+            "required_info": ("allergies",),
+        }),
+        MappingProxyType({
             "stage": "additional_symptoms",
             "assistant_message": "Besides your main symptom, are you experiencing any other symptoms? Such as fever, nausea, dizziness, etc.?",
-            "required_info": ["additional_symptoms"],
-        },
-    ]
+            "required_info": ("additional_symptoms",),
+        }),
+    )
+    
+    # Oldest messages are dropped past this, bounding long-lived sessions
+    HISTORY_MAX_MESSAGES = 200
     
     def __init__(self):
         self.patient_profile = PatientProfile()
         self.current_stage = 0
-        self.conversation_history: List[Tuple[str, str]] = []
+        self.conversation_history: Deque[Tuple[str, str]] = deque(maxlen=self.HISTORY_MAX_MESSAGES)
         self.emergency_detected = False
         self.triage_complete = False
         
@@ -183,10 +268,40 @@ class TriageEngine:
         Process user input and extract information
         Returns structured response with extracted data and next question
         """
-        self.conversation_history.append(("user", user_input))
+        # Lowercased once for trigger scanning and every field extractor
+        text_lower = user_input.lower()
+        return self._process_turn(user_input, text_lower, self._check_emergency_triggers(text_lower))
+    
+    def process_batch(self, inputs: List[str]) -> List[Dict]:
+        """
+        process_user_input for each turn of a transcript, in order (offline
+        replay / evaluation); emergency triggers for all turns are found in one
+        scan over the joined transcript
+        """
+        lowered = [user_input.lower() for user_input in inputs]
+        
+        # Start offset of each turn in the joined buffer; no trigger contains
+        # the separator, so a match never spans two turns
+        offsets, position = [], 0
+        for text_lower in lowered:
+            offsets.append(position)
+            position += len(text_lower) + len(self._BATCH_SEPARATOR)
+        
+        triggers: List[Optional[str]] = [None] * len(inputs)
+        for match in self._EMERGENCY_TRIGGER_RE.finditer(self._BATCH_SEPARATOR.join(lowered)):
+            turn = bisect.bisect_right(offsets, match.start()) - 1
+            if triggers[turn] is None:
+                triggers[turn] = match.group(0)
         
-        # Check for emergency triggers
-        if self._check_emergency_triggers(user_input):
+        return [
+            self._process_turn(user_input, text_lower, self._report_emergency_trigger(trigger))
+            for user_input, text_lower, trigger in zip(inputs, lowered, triggers)
+        ]
+    
+    def _process_turn(self, user_input: str, text_lower: str, emergency: bool) -> Dict:
+        """One conversation turn once the emergency check has run"""
+        if emergency:
+            self.conversation_history.append(("user", user_input))
             self.emergency_detected = True
             return {
                 "emergency_detected": True,
@@ -195,21 +310,22 @@ class TriageEngine:
             }
         
         # Extract information based on current stage
-        current_flow = self.CONVERSATION_FLOW[self.current_stage - 1] if self.current_stage > 0 else None
-        
-        if current_flow:
-            self._extract_information(user_input, current_flow["required_info"])
+        if self.current_stage > 0:
+            extractors = self._STAGE_EXTRACTORS[self.current_stage - 1]
+            if extractors:
+                self._run_extractors(extractors, user_input, text_lower)
         
         # Get next question
         if self.current_stage < len(self.CONVERSATION_FLOW):
             next_question = self.get_next_question()
-            self.conversation_history.append(("assistant", next_question))
+            self.conversation_history.extend((("user", user_input), ("assistant", next_question)))
             return {
                 "emergency_detected": False,
                 "message": next_question,
                 "should_continue": True,
             }
         else:
+            self.conversation_history.append(("user", user_input))
             self.triage_complete = True
             return {
                 "emergency_detected": False,
@@ -217,73 +333,91 @@ class TriageEngine:
                 "should_continue": False,
             }
     
-    def _check_emergency_triggers(self, text: str) -> bool:
-        """Check if text contains emergency trigger keywords"""
-        text_lower = text.lower()
-        
-        for category, triggers in self.EMERGENCY_TRIGGERS.items():
-            for trigger in triggers:
-                if trigger in text_lower:
-                    logger.warning(f"Emergency trigger detected: {trigger}")
-                    return True
+    def _check_emergency_triggers(self, text_lower: str) -> bool:
+        """Check if already-lowercased text contains emergency trigger keywords"""
+        return self._report_emergency_trigger(self._scan_emergency_triggers(text_lower))
+    
+    def _report_emergency_trigger(self, trigger: Optional[str]) -> bool:
+        if trigger:
+            logger.warning(f"Emergency trigger detected: {trigger} ({self._TRIGGER_CATEGORIES[trigger]})")
+            return True
         
         return False
     
-    def _extract_information(self, user_input: str, required_fields: List[str]) -> None:
-        """Extract relevant information from user input"""
-        text = user_input.lower().strip()
-        
-        for field in required_fields:
-            if field == "age":
-                # Simple age extraction
-                import re
-                age_match = re.search(r'\b(\d{1,3})\b', user_input)
-                if age_match:
-                    self.patient_profile.age = int(age_match.group(1))
-            
-            elif field == "gender":
-                if "male" in text or "man" in text or "boy" in text or "m" in text.split():
-                    self.patient_profile.gender = "Male"
-                elif "female" in text or "woman" in text or "girl" in text or "f" in text.split():
-                    self.patient_profile.gender = "Female"
-                else:
-                    self.patient_profile.gender = "Not specified"
-            
-            elif field == "primary_symptom":
-                self.patient_profile.primary_symptom = user_input
-            
-            elif field == "duration":
-                self.patient_profile.duration = user_input
-            
-            elif field == "severity_score":
-                import re
-                score_match = re.search(r'(\d+)', user_input)
-                if score_match:
-                    score = int(score_match.group(1))
-                    self.patient_profile.severity_score = min(10, max(0, score))
-            
-            elif field == "medical_history":
-                conditions = {
-                    "diabetes": "diabetes" in text,
-                    "hypertension": ("high blood pressure" in text or "hypertension" in text or "bp" in text),
-                    "asthma": "asthma" in text,
-                    "heart_disease": ("heart" in text or "cardiac" in text),
-                    "stroke_history": ("stroke" in text or "tia" in text),
-                    "kidney_disease": "kidney" in text,
-                }
-                self.patient_profile.medical_history.update(conditions)
-            
-            elif field == "current_medications":
-                if "no" not in text and "none" not in text:
-                    self.patient_profile.current_medications = [m.strip() for m in user_input.split(",")]
-            
-            elif field == "allergies":
-                if "no" not in text and "none" not in text:
-                    self.patient_profile.allergies = [a.strip() for a in user_input.split(",")]
-            
-            elif field == "additional_symptoms":
-                if "no" not in text and "none" not in text:
-                    self.patient_profile.additional_symptoms = [s.strip() for s in user_input.split(",")]
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _scan_emergency_triggers(text_lower: str) -> Optional[str]:
+        """Matched trigger phrase or None; cached since short replies repeat across sessions"""
+        match = TriageEngine._EMERGENCY_TRIGGER_RE.search(text_lower)
+        return match.group(0) if match else None
+    
+    def _run_extractors(self, extractors: Tuple, user_input: str, text: str) -> None:
+        """Extract relevant information from user input (text is its lowercased form)"""
+        for extractor in extractors:
+            extractor(self, user_input, text)
+    
+    def _extract_age(self, user_input: str, text: str) -> None:
+        # Simple age extraction
+        age_match = self._AGE_RE.search(user_input)
+        if age_match:
+            self.patient_profile.age = int(age_match.group(1))
+    
+    def _extract_gender(self, user_input: str, text: str) -> None:
+        found = {match.lastgroup for match in self._GENDER_RE.finditer(text)}
+        if "male" in found:
+            self.patient_profile.gender = "Male"
+        elif "female" in found:
+            self.patient_profile.gender = "Female"
+        else:
+            self.patient_profile.gender = "Not specified"
+    
+    def _extract_primary_symptom(self, user_input: str, text: str) -> None:
+        self.patient_profile.primary_symptom = user_input
+    
+    def _extract_duration(self, user_input: str, text: str) -> None:
+        self.patient_profile.duration = user_input
+    
+    def _extract_severity_score(self, user_input: str, text: str) -> None:
+        score_match = self._SCORE_RE.search(user_input)
+        if score_match:
+            # \d+ never yields a negative score, so only the top needs clamping
+            score = int(score_match.group(1))
+            self.patient_profile.severity_score = 10 if score > 10 else score
+    
+    def _extract_medical_history(self, user_input: str, text: str) -> None:
+        # Every condition is answered on this turn: unmentioned ones become False
+        conditions = dict.fromkeys(self._MEDICAL_HISTORY_TERMS.values(), False)
+        for match in self._MEDICAL_HISTORY_RE.finditer(text):
+            conditions[self._MEDICAL_HISTORY_TERMS[match.group(1)]] = True
+        self.patient_profile.medical_history.update(conditions)
+    
+    def _extract_current_medications(self, user_input: str, text: str) -> None:
+        if "no" not in text and "none" not in text:
+            self.patient_profile.current_medications = [m.strip() for m in user_input.split(",")]
+    
+    def _extract_allergies(self, user_input: str, text: str) -> None:
+        if "no" not in text and "none" not in text:
+            self.patient_profile.allergies = [a.strip() for a in user_input.split(",")]
+    
+    def _extract_additional_symptoms(self, user_input: str, text: str) -> None:
+        if "no" not in text and "none" not in text:
+            self.patient_profile.additional_symptoms = [s.strip() for s in user_input.split(",")]
+    
+    # required_info field -> extractor, looked up once per field
+    _EXTRACTORS = {
+        "age": _extract_age,
+        "gender": _extract_gender,
+        "primary_symptom": _extract_primary_symptom,
+        "duration": _extract_duration,
+        "severity_score": _extract_severity_score,
+        "medical_history": _extract_medical_history,
+        "current_medications": _extract_current_medications,
+        "allergies": _extract_allergies,
+        "additional_symptoms": _extract_additional_symptoms,
+    }
+    # Extractors for each CONVERSATION_FLOW stage, resolved once; kept on the
+    # class (not per instance) so engines still pickle into the session store
+    _STAGE_EXTRACTORS = _stage_extractors(CONVERSATION_FLOW, _EXTRACTORS)
     
     def get_patient_profile(self) -> PatientProfile:
         """Return current patient profile"""
@@ -291,12 +425,12 @@ class TriageEngine:
     
     def get_conversation_history(self) -> List[Tuple[str, str]]:
         """Return conversation history"""
-        return self.conversation_history
+        return list(self.conversation_history)
     
     def reset(self) -> None:
         """Reset engine for new conversation"""
         self.patient_profile = PatientProfile()
         self.current_stage = 0
-        self.conversation_history = []
+        self.conversation_history = deque(maxlen=self.HISTORY_MAX_MESSAGES)
         self.emergency_detected = False
         self.triage_complete = False